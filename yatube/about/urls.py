@@ -1,10 +1,15 @@
 from django.urls import path
+
+from core.query_budget import query_budget
+
 from . import views
 
 
 app_name = 'about'
 
 urlpatterns = [
-    path('author/', views.AboutAuthorView.as_view(), name='author'),
-    path('tech/', views.AboutTechView.as_view(), name='tech'),
+    path('author/', query_budget(2)(views.AboutAuthorView.as_view()),
+         name='author'),
+    path('tech/', query_budget(2)(views.AboutTechView.as_view()),
+         name='tech'),
 ]
@@ -0,0 +1,68 @@
+from django.contrib import admin
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
+
+from .models import RequestProfile
+
+
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = (
+        'pub_date',
+        'method',
+        'path',
+        'route',
+        'status',
+        'duration_ms',
+        'sql_count',
+        'user',
+    )
+    list_filter = ('route', 'status')
+    exclude = ('stacks', 'queries')
+    readonly_fields = ('downloads',)
+    empty_value_display = '-пусто-'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        view = self.admin_site.admin_view
+        return [
+            path('<int:pk>/stacks/', view(self.download_stacks),
+                 name='core_requestprofile_stacks'),
+            path('<int:pk>/queries/', view(self.download_queries),
+                 name='core_requestprofile_queries'),
+        ] + super().get_urls()
+
+    def downloads(self, obj):
+        return format_html(
+            '<a href="{}">стеки вызовов</a> · <a href="{}">SQL-запросы</a>',
+            reverse('admin:core_requestprofile_stacks', args=(obj.pk,)),
+            reverse('admin:core_requestprofile_queries', args=(obj.pk,)),
+        )
+    downloads.short_description = 'Скачать'
+
+    def _download(self, request, pk, field, content_type, extension):
+        if not self.has_view_permission(request):
+            return HttpResponse(status=403)
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        response = HttpResponse(getattr(profile, field),
+                                content_type=content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="profile-{pk}-{field}.{extension}"')
+        return response
+
+    def download_stacks(self, request, pk):
+        return self._download(request, pk, 'stacks',
+                              'text/plain; charset=utf-8', 'txt')
+
+    def download_queries(self, request, pk):
+        return self._download(request, pk, 'queries',
+                              'application/json; charset=utf-8', 'json')
+
+
+admin.site.register(RequestProfile, RequestProfileAdmin)
@@ -0,0 +1,279 @@
+"""Двухуровневый кэш: маленький LRU в процессе поверх общего бэкенда.
+
+Пример настройки::
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.TwoTierCache',
+            'OPTIONS': {'SHARED': 'shared', 'LOCAL_MAX_ENTRIES': 1000},
+        },
+        'shared': {...},
+    }
+
+Устаревшее значение в get_or_set пересчитывает только один запрос,
+остальные в это время получают старое значение (stale-while-revalidate);
+простой get отдаёт старое значение до конца STALE_GRACE. Значения без
+срока (счётчики, версии страниц) всегда читаются из общего уровня, чтобы
+их изменение сразу видели все воркеры.
+"""
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from . import timing
+
+
+Entry = namedtuple('Entry', ('value', 'stale_at'))
+
+_MISSING = object()
+_local_stores: dict = {}
+_local_stores_lock = threading.Lock()
+
+
+class LocalStore:
+    """Потокобезопасный LRU с ограничением числа записей и TTL."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.data: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(
+            ('local_hits', 'shared_hits', 'stale_hits', 'misses',
+             'evictions', 'coalesced'), 0)
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return _MISSING
+            pickled, expires_at = item
+            if expires_at < time.monotonic():
+                del self.data[key]
+                return _MISSING
+            self.data.move_to_end(key)
+        return pickle.loads(pickled)
+
+    def set(self, key, value, ttl):
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            self.data[key] = (pickled, time.monotonic() + ttl)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+
+def _get_local_store(name, max_entries) -> LocalStore:
+    with _local_stores_lock:
+        if name not in _local_stores:
+            _local_stores[name] = LocalStore(max_entries)
+        return _local_stores[name]
+
+
+class TwoTierCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options.get('SHARED', 'shared')
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self._stale_grace = options.get('STALE_GRACE', 60)
+        self._lock_timeout = options.get('LOCK_TIMEOUT', 10)
+        self._lock_wait = options.get('LOCK_WAIT', 2)
+        self._local = _get_local_store(
+            location or self._shared_alias,
+            options.get('LOCAL_MAX_ENTRIES', 1000),
+        )
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def _timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT:
+            return self.default_timeout
+        return timeout
+
+    def _wrap(self, value, timeout):
+        """Значения без срока храним как есть: incr остаётся атомарным."""
+        if timeout is None:
+            return value, None
+        return Entry(value, time.time() + timeout), timeout + self._stale_grace
+
+    def _count(self, name):
+        """Счётчик процесса и замеры текущего запроса."""
+        self._local.count(name)
+        timing.count('cache_misses' if name == 'misses' else 'cache_hits')
+
+    def _lock_key(self, key):
+        return f'{key}:lock'
+
+    def _take(self, name, version):
+        """Токен владельца, если блокировку name удалось взять, иначе None."""
+        token = uuid.uuid4().hex
+        if self.shared.add(name, token, self._lock_timeout, version):
+            return token
+        return None
+
+    def _give_back(self, name, version, token):
+        """Снимает блокировку, только если она всё ещё наша."""
+        # Наша могла истечь и достаться другому воркеру: её не трогаем.
+        if token and self.shared.get(name, None, version) == token:
+            self.shared.delete(name, version)
+
+    def _acquire(self, key, version):
+        return self._take(self._lock_key(key), version)
+
+    def _release(self, key, version, token):
+        self._give_back(self._lock_key(key), version, token)
+
+    def _fetch(self, key, version):
+        """Запись из локального уровня, затем из общего."""
+        local_key = self.make_key(key, version)
+        entry = self._local.get(local_key)
+        if entry is not _MISSING:
+            self._count('local_hits')
+            return entry
+        entry = self.shared.get(key, _MISSING, version)
+        if entry is not _MISSING:
+            self._count('shared_hits')
+            if isinstance(entry, Entry):
+                self._local.set(local_key, entry, self._local_timeout)
+        return entry
+
+    def get(self, key, default=None, version=None):
+        entry = self._fetch(key, version)
+        if entry is _MISSING:
+            self._count('misses')
+            return default
+        if not isinstance(entry, Entry):
+            return entry
+        if entry.stale_at <= time.time():
+            self._count('stale_hits')
+        return entry.value
+
+    def has_key(self, key, version=None):
+        return self._fetch(key, version) is not _MISSING
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        value, shared_timeout = self._wrap(value, self._timeout(timeout))
+        return self.shared.add(key, value, shared_timeout, version)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._timeout(timeout)
+        if timeout is not None and timeout <= 0:
+            self.delete(key, version)
+            return
+        entry, shared_timeout = self._wrap(value, timeout)
+        self.shared.set(key, entry, shared_timeout, version)
+        local_key = self.make_key(key, version)
+        if isinstance(entry, Entry):
+            self._local.set(local_key, entry, self._local_timeout)
+        else:
+            self._local.delete(local_key)
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        """get_or_set, при котором значение вычисляет один запрос."""
+        entry = self._fetch(key, version)
+        if entry is not _MISSING and not isinstance(entry, Entry):
+            return entry
+        if entry is not _MISSING and entry.stale_at > time.time():
+            return entry.value
+        if not callable(default):
+            self.set(key, default, timeout, version)
+            return default
+        token = self._acquire(key, version)
+        if token is None:
+            if entry is not _MISSING:
+                self._count('stale_hits')
+                return entry.value
+            deadline = time.monotonic() + self._lock_wait
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                entry = self.shared.get(key, _MISSING, version)
+                if entry is not _MISSING:
+                    self._count('coalesced')
+                    return entry.value if isinstance(entry, Entry) else entry
+        self._count('misses')
+        try:
+            value = default()
+            self.set(key, value, timeout, version)
+        finally:
+            self._release(key, version, token)
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        """Новый срок без set(): блокировку пересчёта держит не touch."""
+        entry = self._fetch(key, version)
+        if entry is _MISSING:
+            return False
+        value = entry.value if isinstance(entry, Entry) else entry
+        entry, shared_timeout = self._wrap(value, self._timeout(timeout))
+        self.shared.set(key, entry, shared_timeout, version)
+        self._local.delete(self.make_key(key, version))
+        return True
+
+    def delete(self, key, version=None):
+        self._local.delete(self.make_key(key, version))
+        self.shared.delete(key, version)
+
+    @contextmanager
+    def _mutex(self, key, version):
+        """Взаимное исключение воркеров через add() в общем кэше."""
+        name = f'{key}:mutex'
+        deadline = time.monotonic() + self._lock_timeout
+        token = self._take(name, version)
+        while token is None:
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f'{name} is held by another worker')
+            time.sleep(0.001)
+            token = self._take(name, version)
+        try:
+            yield
+        finally:
+            self._give_back(name, version, token)
+
+    def incr(self, key, delta=1, version=None):
+        """Счётчики без срока меняет общий кэш, со сроком — под mutex."""
+        self._local.delete(self.make_key(key, version))
+        entry = self.shared.get(key, _MISSING, version)
+        if entry is _MISSING:
+            raise ValueError("Key '%s' not found" % key)
+        if not isinstance(entry, Entry):
+            return self.shared.incr(key, delta, version)
+        with self._mutex(key, version):
+            entry = self.shared.get(key, _MISSING, version)
+            if entry is _MISSING:
+                raise ValueError("Key '%s' not found" % key)
+            value = entry.value + delta
+            ttl = max(entry.stale_at - time.time(), 1)
+            self.shared.set(key, entry._replace(value=value),
+                            ttl + self._stale_grace, version)
+        self._local.delete(self.make_key(key, version))
+        return value
+
+    def clear(self):
+        self._local.clear()
+        self.shared.clear()
+
+    def stats(self) -> dict:
+        """Счётчики попаданий, промахов и вытеснений этого процесса."""
+        with self._local.lock:
+            return dict(self._local.counters, local_size=len(self._local.data))
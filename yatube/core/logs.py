@@ -0,0 +1,15 @@
+"""Обработчики логов; подключаются из LOGGING до загрузки приложений."""
+import logging
+import os
+
+
+class PrivateFileHandler(logging.FileHandler):
+    """FileHandler, который создаёт лог с правами 0600."""
+
+    def _open(self):
+        directory = os.path.dirname(self.baseFilename)
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        fd = os.open(self.baseFilename,
+                     os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        return open(fd, self.mode, encoding=self.encoding,
+                    errors=self.errors)
@@ -0,0 +1,252 @@
+"""Метрики запросов в формате Prometheus, общие для всех воркеров узла.
+
+Счётчики лежат в memory-mapped файле METRICS_PATH (хэш-таблица ключ →
+float64) и меняются под fcntl-блокировкой, поэтому каждый воркер видит
+итоги всего узла. TimingMiddleware после каждого запроса добавляет
+наблюдения одной блокировкой; /metrics читает таблицу целиком.
+Когда таблица заполнена, новые серии отбрасываются и учитываются в
+yatube_metrics_dropped_series_total. Отдаются метрики только адресам
+METRICS_ALLOWED_IPS или по токену METRICS_TOKEN.
+"""
+import hashlib
+import hmac
+import logging
+import re
+import struct
+from collections import Counter, defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+from .mmap_cache import HEADER, _get_shared_file
+
+
+logger = logging.getLogger(__name__)
+
+SLOT_SIZE: int = 256
+SLOT_HEADER = struct.Struct('<Hd')
+KEY_SIZE = SLOT_SIZE - SLOT_HEADER.size
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+# Имя: (тип, описание, границы корзин гистограммы).
+METRICS = {
+    'yatube_requests_total': (
+        'counter', 'Запросы по маршруту и статусу ответа.', None),
+    'yatube_request_duration_seconds': (
+        'histogram', 'Время ответа по маршруту.', LATENCY_BUCKETS),
+    'yatube_db_queries_per_request': (
+        'histogram', 'SQL-запросов на один запрос.', QUERY_BUCKETS),
+    'yatube_db_duration_seconds': (
+        'histogram', 'Время SQL-запросов одного запроса.', LATENCY_BUCKETS),
+    'yatube_cache_hits_total': (
+        'counter', 'Попадания в кэш по маршруту.', None),
+    'yatube_cache_misses_total': (
+        'counter', 'Промахи кэша по маршруту.', None),
+    'yatube_metrics_dropped_series_total': (
+        'counter', 'Серии, не поместившиеся в таблицу метрик.', None),
+}
+DROPPED_KEY = 'yatube_metrics_dropped_series_total{}'
+# COUNT(*) для yatube_table_rows считается не чаще раза в столько секунд.
+TABLE_ROWS_TIMEOUT: int = 60
+SUFFIXES = {'_bucket': 0, '_sum': 1, '_count': 2}
+LE_RE = re.compile(r',?le="([^"]+)"')
+
+
+class SharedCounters:
+    """Хэш-таблица счётчиков с открытой адресацией в общем файле."""
+
+    def __init__(self, path, slots):
+        self.shared = _get_shared_file(path, slots, SLOT_SIZE)
+
+    def _locked(self):
+        shared = self.shared
+        return shared.locked(HEADER.size, shared.size - HEADER.size)
+
+    def _offset(self, key_bytes, create):
+        """Смещение слота ключа; новый слот занимается при create."""
+        shared = self.shared
+        start = int.from_bytes(hashlib.blake2b(
+            key_bytes, digest_size=8).digest(), 'little')
+        for probe in range(shared.slots):
+            offset = (HEADER.size
+                      + (start + probe) % shared.slots * SLOT_SIZE)
+            key_len, _ = SLOT_HEADER.unpack_from(shared.map, offset)
+            if key_len == 0:
+                if not create:
+                    return None
+                data = offset + SLOT_HEADER.size
+                shared.map[data:data + len(key_bytes)] = key_bytes
+                SLOT_HEADER.pack_into(shared.map, offset, len(key_bytes), 0)
+                return offset
+            data = offset + SLOT_HEADER.size
+            if shared.map[data:data + key_len] == key_bytes:
+                return offset
+        return None
+
+    def _add(self, offset, delta):
+        key_len, value = SLOT_HEADER.unpack_from(self.shared.map, offset)
+        SLOT_HEADER.pack_into(self.shared.map, offset, key_len,
+                              value + delta)
+
+    def add_many(self, deltas) -> None:
+        """Прибавляет значения; не поместившиеся ключи отбрасываются.
+
+        Счётчик отброшенных серий заводится первым, пока в таблице
+        есть место, и поэтому есть всегда.
+        """
+        dropped = 0
+        with self._locked():
+            dropped_offset = self._offset(DROPPED_KEY.encode(), create=True)
+            for key, delta in deltas.items():
+                key_bytes = key.encode()
+                offset = (self._offset(key_bytes, create=True)
+                          if len(key_bytes) <= KEY_SIZE else None)
+                if offset is None:
+                    dropped += 1
+                    continue
+                self._add(offset, delta)
+            if dropped and dropped_offset is not None:
+                self._add(dropped_offset, dropped)
+        if dropped:
+            logger.warning('Таблица метрик заполнена: отброшено серий %d',
+                           dropped)
+
+    def items(self) -> dict:
+        shared = self.shared
+        result = {}
+        with self._locked():
+            for slot in range(shared.slots):
+                offset = HEADER.size + slot * SLOT_SIZE
+                key_len, value = SLOT_HEADER.unpack_from(shared.map, offset)
+                if key_len:
+                    data = offset + SLOT_HEADER.size
+                    key = bytes(shared.map[data:data + key_len]).decode()
+                    result[key] = value
+        return result
+
+    def clear(self) -> None:
+        with self._locked():
+            self.shared.map[HEADER.size:] = bytes(
+                self.shared.size - HEADER.size)
+
+
+def is_allowed(request) -> bool:
+    """Метрики видны внутренним адресам и владельцу токена."""
+    if request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS:
+        return True
+    token = settings.METRICS_TOKEN
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and hmac.compare_digest(header, f'Bearer {token}')
+
+
+def get_store():
+    """Таблица счётчиков узла или None, если метрики выключены."""
+    if not settings.METRICS_PATH:
+        return None
+    return SharedCounters(settings.METRICS_PATH, settings.METRICS_SLOTS)
+
+
+def series(name, **labels) -> str:
+    return name + '{' + ','.join(
+        f'{label}="{value}"' for label, value in labels.items()) + '}'
+
+
+def _observe(deltas, name, value, **labels):
+    """Кумулятивные корзины гистограммы, её сумма и число наблюдений."""
+    for bound in METRICS[name][2]:
+        deltas[series(f'{name}_bucket', **labels, le=bound)] += (
+            1 if value <= bound else 0)
+    deltas[series(f'{name}_bucket', **labels, le='+Inf')] += 1
+    deltas[series(f'{name}_sum', **labels)] += value
+    deltas[series(f'{name}_count', **labels)] += 1
+
+
+def observe_request(route, status, duration, timings) -> None:
+    store = get_store()
+    if store is None:
+        return
+    deltas = Counter()
+    deltas[series('yatube_requests_total', route=route, status=status)] += 1
+    _observe(deltas, 'yatube_request_duration_seconds', duration,
+             route=route)
+    _observe(deltas, 'yatube_db_queries_per_request', timings.counts['db'],
+             route=route)
+    _observe(deltas, 'yatube_db_duration_seconds', timings.durations['db'],
+             route=route)
+    deltas[series('yatube_cache_hits_total', route=route)] += (
+        timings.counts['cache_hits'])
+    deltas[series('yatube_cache_misses_total', route=route)] += (
+        timings.counts['cache_misses'])
+    store.add_many(deltas)
+
+
+def _family(key):
+    name = key.split('{', 1)[0]
+    if name in METRICS:
+        return name
+    base, _, suffix = name.rpartition('_')
+    if f'_{suffix}' in SUFFIXES and base in METRICS:
+        return base
+    return None
+
+
+def _sort_key(item):
+    """Серии одного набора меток подряд, корзины по возрастанию le."""
+    name, labels = item[0].split('{', 1)
+    match = LE_RE.search(labels)
+    bound = float(match.group(1)) if match else 0.0
+    suffix = SUFFIXES.get('_' + name.rpartition('_')[2], 0)
+    return LE_RE.sub('', labels), suffix, bound
+
+
+def _cache_ratios(values):
+    hits, totals = defaultdict(float), defaultdict(float)
+    for key, value in values.items():
+        for name in ('yatube_cache_hits_total', 'yatube_cache_misses_total'):
+            if key.startswith(name + '{'):
+                labels = key[len(name):]
+                totals[labels] += value
+                if name == 'yatube_cache_hits_total':
+                    hits[labels] += value
+    return {labels: hits[labels] / total
+            for labels, total in totals.items() if total}
+
+
+def table_rows(model, counter=None) -> int:
+    """Строки таблицы из готового счётчика или из кэша COUNT(*)."""
+    if counter is not None:
+        return import_string(counter)()
+    return cache.get_or_set(f'metrics:rows:{model._meta.label_lower}',
+                            model._default_manager.count,
+                            TABLE_ROWS_TIMEOUT)
+
+
+def render() -> str:
+    """Все метрики узла в текстовом формате Prometheus."""
+    store = get_store()
+    values = store.items() if store is not None else {}
+    families = defaultdict(list)
+    for key, value in values.items():
+        name = _family(key)
+        if name is not None:
+            families[name].append((key, value))
+    lines = []
+    for name, (kind, help_text, _) in METRICS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        lines += [f'{key} {value!r}'
+                  for key, value in sorted(families[name], key=_sort_key)]
+    lines += ['# HELP yatube_cache_hit_ratio Доля попаданий в кэш.',
+              '# TYPE yatube_cache_hit_ratio gauge']
+    lines += [f'yatube_cache_hit_ratio{labels} {ratio!r}'
+              for labels, ratio in sorted(_cache_ratios(values).items())]
+    lines += ['# HELP yatube_table_rows Строк в таблице.',
+              '# TYPE yatube_table_rows gauge']
+    for label, counter in settings.METRICS_TABLE_GAUGES.items():
+        model = apps.get_model(label)
+        lines.append(f'yatube_table_rows{{table="{model._meta.db_table}"}} '
+                     f'{table_rows(model, counter)}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,39 @@
+# Generated by Django 2.2.16 on 2026-10-18 20:20
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')),
+                ('method', models.CharField(max_length=10, verbose_name='Метод')),
+                ('path', models.CharField(max_length=2000, verbose_name='Адрес')),
+                ('route', models.CharField(blank=True, max_length=200, verbose_name='Маршрут')),
+                ('status', models.PositiveSmallIntegerField(verbose_name='Статус')),
+                ('duration_ms', models.FloatField(verbose_name='Время, мс')),
+                ('sql_count', models.PositiveIntegerField(verbose_name='SQL-запросов')),
+                ('sql_ms', models.FloatField(verbose_name='Время SQL, мс')),
+                ('stacks', models.TextField(verbose_name='Стеки вызовов (folded)')),
+                ('queries', models.TextField(verbose_name='SQL-запросы и планы (JSON)')),
+                ('user', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Профиль запроса',
+                'verbose_name_plural': 'Профили запросов',
+                'ordering': ('-pub_date',),
+            },
+        ),
+    ]
@@ -0,0 +1,284 @@
+"""Кэш в общем memory-mapped файле для всех воркеров одного узла.
+
+Файл разбит на группы слотов фиксированного размера. Ключ попадает в
+группу по хэшу; группа блокируется через fcntl, поэтому get/set/incr
+атомарны между процессами. При нехватке места вытесняется запись группы,
+которую дольше всех не читали (приближённый LRU). clear() не трогает
+слоты, а увеличивает поколение в заголовке файла: записи прошлых
+поколений считаются пустыми.
+
+Пример настройки::
+
+    CACHES = {
+        'shared': {
+            'BACKEND': 'core.mmap_cache.MmapCache',
+            'LOCATION': '/dev/shm/yatube-cache',
+            'OPTIONS': {'SLOTS': 65536, 'SLOT_SIZE': 4096},
+        },
+    }
+"""
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+MAGIC = b'YTMMAP02'
+# Метка формата, число слотов, размер слота, поколение.
+HEADER = struct.Struct('<8sIII')
+# Состояние, поколение, хэш ключа, срок, время чтения, длины ключа и
+# значения.
+SLOT_HEADER = struct.Struct('<BIQddHI')
+GROUP_SIZE: int = 8
+
+EMPTY, USED = 0, 1
+
+_maps: dict = {}
+_maps_lock = threading.Lock()
+
+
+def _open_private(path) -> int:
+    """Открывает файл, созданный этим пользователем, не следуя по ссылке.
+
+    Из файла читаются pickle-данные: чужой файл или ссылка на него
+    означали бы выполнение чужого кода.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+    if os.fstat(fd).st_uid != os.geteuid():
+        os.close(fd)
+        raise PermissionError(f'{path} belongs to another user')
+    return fd
+
+
+class SharedFile:
+    """Открытый и отображённый в память файл кэша одного процесса."""
+
+    def __init__(self, path, slots, slot_size):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.groups = max(slots // GROUP_SIZE, 1)
+        self.size = HEADER.size + slots * slot_size
+        self.fd = _open_private(path)
+        self.thread_lock = threading.RLock()
+        with self.locked(0, HEADER.size):
+            if (os.fstat(self.fd).st_size != self.size
+                    or HEADER.unpack(os.pread(self.fd, HEADER.size, 0))[:3]
+                    != (MAGIC, slots, slot_size)):
+                # Файл другого формата обнуляется без записи в каждую
+                # страницу: усечение до нуля и обратно.
+                os.ftruncate(self.fd, 0)
+                os.ftruncate(self.fd, self.size)
+                os.pwrite(self.fd, HEADER.pack(MAGIC, slots, slot_size, 0),
+                          0)
+            self.map = mmap.mmap(self.fd, self.size)
+
+    @contextmanager
+    def locked(self, start, length):
+        with self.thread_lock:
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, length, start)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, length, start)
+
+    def group_range(self, group):
+        start = HEADER.size + group * GROUP_SIZE * self.slot_size
+        return start, GROUP_SIZE * self.slot_size
+
+    @property
+    def generation(self) -> int:
+        return HEADER.unpack_from(self.map)[3]
+
+    def next_generation(self) -> None:
+        with self.locked(0, HEADER.size):
+            magic, slots, slot_size, generation = HEADER.unpack_from(
+                self.map)
+            HEADER.pack_into(self.map, 0, magic, slots, slot_size,
+                             (generation + 1) % 2 ** 32)
+
+    def read_slot(self, offset):
+        return SLOT_HEADER.unpack_from(self.map, offset)
+
+    def clear_slot(self, offset):
+        self.map[offset] = EMPTY
+
+
+def _get_shared_file(path, slots, slot_size) -> SharedFile:
+    key = (os.getpid(), path)
+    with _maps_lock:
+        if key not in _maps:
+            _maps[key] = SharedFile(path, slots, slot_size)
+        return _maps[key]
+
+
+class MmapCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._slots = options.get('SLOTS', 65536)
+        self._slot_size = options.get('SLOT_SIZE', 4096)
+
+    @property
+    def _file(self) -> SharedFile:
+        return _get_shared_file(self._path, self._slots, self._slot_size)
+
+    def _digest(self, key):
+        return int.from_bytes(
+            hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little')
+
+    @contextmanager
+    def _group(self, key):
+        """Блокирует группу ключа; отдаёт файл, хэш, ключ и начало группы."""
+        shared = self._file
+        digest = self._digest(key)
+        start, length = shared.group_range(digest % shared.groups)
+        with shared.locked(start, length):
+            yield shared, digest, key.encode(), start
+
+    def _find(self, shared, digest, key_bytes, start):
+        """Смещение живой записи ключа в группе или None."""
+        now = time.time()
+        generation = shared.generation
+        for index in range(GROUP_SIZE):
+            offset = start + index * shared.slot_size
+            state, slot_generation, slot_digest, expires, _, key_len, _ = (
+                shared.read_slot(offset))
+            if (state != USED or slot_generation != generation
+                    or slot_digest != digest):
+                continue
+            data = offset + SLOT_HEADER.size
+            if shared.map[data:data + key_len] != key_bytes:
+                continue
+            if expires and expires <= now:
+                shared.clear_slot(offset)
+                return None
+            return offset
+        return None
+
+    def _victim(self, shared, start):
+        """Пустой или просроченный слот, иначе давно не читанный."""
+        now = time.time()
+        generation = shared.generation
+        victim, oldest = None, None
+        for index in range(GROUP_SIZE):
+            offset = start + index * shared.slot_size
+            state, slot_generation, _, expires, used_at, _, _ = (
+                shared.read_slot(offset))
+            if (state != USED or slot_generation != generation
+                    or expires and expires <= now):
+                return offset
+            if oldest is None or used_at < oldest:
+                victim, oldest = offset, used_at
+        return victim
+
+    def _read_value(self, shared, offset):
+        *_, key_len, value_len = shared.read_slot(offset)
+        data = offset + SLOT_HEADER.size + key_len
+        return pickle.loads(shared.map[data:data + value_len])
+
+    def _write(self, shared, offset, digest, key_bytes, value, expires):
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        room = shared.slot_size - SLOT_HEADER.size
+        if len(key_bytes) + len(pickled) > room:
+            return False
+        data = offset + SLOT_HEADER.size
+        shared.map[data:data + len(key_bytes)] = key_bytes
+        data += len(key_bytes)
+        shared.map[data:data + len(pickled)] = pickled
+        SLOT_HEADER.pack_into(shared.map, offset, USED, shared.generation,
+                              digest, expires, time.time(), len(key_bytes),
+                              len(pickled))
+        return True
+
+    def _expires(self, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        return 0.0 if timeout is None else timeout
+
+    def _touch_slot(self, shared, offset):
+        state, generation, digest, expires, _, key_len, value_len = (
+            shared.read_slot(offset))
+        SLOT_HEADER.pack_into(shared.map, offset, state, generation, digest,
+                              expires, time.time(), key_len, value_len)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        with self._group(key) as (shared, digest, key_bytes, start):
+            offset = self._find(shared, digest, key_bytes, start)
+            if offset is None:
+                return default
+            self._touch_slot(shared, offset)
+            return self._read_value(shared, offset)
+
+    def _store(self, key, value, timeout, version, replace):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        with self._group(key) as (shared, digest, key_bytes, start):
+            offset = self._find(shared, digest, key_bytes, start)
+            if offset is not None:
+                if not replace:
+                    return False
+                shared.clear_slot(offset)
+            offset = self._victim(shared, start)
+            return self._write(shared, offset, digest, key_bytes, value,
+                               self._expires(timeout))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._store(key, value, timeout, version, replace=False)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._store(key, value, timeout, version, replace=True)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        with self._group(key) as (shared, digest, key_bytes, start):
+            offset = self._find(shared, digest, key_bytes, start)
+            if offset is None:
+                return False
+            state, generation, digest, _, used_at, key_len, value_len = (
+                shared.read_slot(offset))
+            SLOT_HEADER.pack_into(shared.map, offset, state, generation,
+                                  digest, self._expires(timeout), used_at,
+                                  key_len, value_len)
+            return True
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        with self._group(key) as (shared, digest, key_bytes, start):
+            offset = self._find(shared, digest, key_bytes, start)
+            if offset is not None:
+                shared.clear_slot(offset)
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        with self._group(key) as (shared, digest, key_bytes, start):
+            return self._find(shared, digest, key_bytes, start) is not None
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        with self._group(key) as (shared, digest, key_bytes, start):
+            offset = self._find(shared, digest, key_bytes, start)
+            if offset is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = self._read_value(shared, offset) + delta
+            expires = shared.read_slot(offset)[3]
+            self._write(shared, offset, digest, key_bytes, value, expires)
+            return value
+
+    def clear(self):
+        self._file.next_generation()
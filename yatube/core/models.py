@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 
 
@@ -6,3 +7,27 @@ class CreatedModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class RequestProfile(CreatedModel):
+    """Профиль одного запроса, снятый по просьбе сотрудника."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True,
+                             on_delete=models.SET_NULL,
+                             verbose_name='Пользователь')
+    method = models.CharField('Метод', max_length=10)
+    path = models.CharField('Адрес', max_length=2000)
+    route = models.CharField('Маршрут', max_length=200, blank=True)
+    status = models.PositiveSmallIntegerField('Статус')
+    duration_ms = models.FloatField('Время, мс')
+    sql_count = models.PositiveIntegerField('SQL-запросов')
+    sql_ms = models.FloatField('Время SQL, мс')
+    stacks = models.TextField('Стеки вызовов (folded)')
+    queries = models.TextField('SQL-запросы и планы (JSON)')
+
+    class Meta:
+        ordering = ('-pub_date',)
+        verbose_name = 'Профиль запроса'
+        verbose_name_plural = 'Профили запросов'
+
+    def __str__(self) -> str:
+        return f'{self.method} {self.path}'
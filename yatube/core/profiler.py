@@ -0,0 +1,180 @@
+"""Профиль одного запроса по просьбе сотрудника.
+
+Запрос сотрудника (is_staff) с параметром ?_profile=1 или заголовком
+X-Profile: 1 выполняется под детерминированным профилировщиком
+(sys.setprofile). Время каждого стека вызовов сохраняется в формате
+folded, который понимают flamegraph.pl и speedscope, вместе со всеми
+SQL-запросами, их временем, местом вызова и планом EXPLAIN QUERY PLAN.
+Профиль лежит в RequestProfile и скачивается из админки; номер профиля
+возвращается в заголовке X-Profile-Id.
+"""
+import json
+import re
+import sys
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+
+from .models import RequestProfile
+from .query_budget import project_frames, unbudgeted
+
+
+PROFILE_PARAM = '_profile'
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+EXPLAINED = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+# Параметры запросов, которые читают или пишут эти таблицы, не
+# сохраняются: там ключи сессий, хеши паролей и почта. JOIN с auth_user
+# в запросах постов сюда не попадает.
+REDACTED_TABLES = re.compile(
+    r'\b(?:FROM|INTO|UPDATE)\s+"?(?:django_session|auth_user)"?(?:\s|$)',
+    re.IGNORECASE)
+
+
+def _function_name(frame):
+    code = frame.f_code
+    qualname = getattr(code, 'co_qualname', code.co_name)
+    return f'{frame.f_globals.get("__name__", "?")}:{qualname}'
+
+
+def _builtin_name(function):
+    module = getattr(function, '__module__', None) or 'builtins'
+    return f'{module}:{getattr(function, "__qualname__", function)}'
+
+
+class StackProfiler:
+    """Собственное время каждого стека вызовов текущего потока."""
+
+    def __init__(self):
+        # Кадры: [путь стека, начало, время вложенных вызовов].
+        self.stack = []
+        self.folded = Counter()
+
+    def __enter__(self):
+        sys.setprofile(self._event)
+        return self
+
+    def __exit__(self, *exc_info):
+        sys.setprofile(None)
+
+    def _event(self, frame, event, arg):
+        now = time.perf_counter()
+        if event == 'call' or event == 'c_call':
+            name = (_function_name(frame) if event == 'call'
+                    else _builtin_name(arg))
+            path = f'{self.stack[-1][0]};{name}' if self.stack else name
+            self.stack.append([path, now, 0.0])
+        elif self.stack:
+            path, started, children = self.stack.pop()
+            elapsed = now - started
+            self.folded[path] += elapsed - children
+            if self.stack:
+                self.stack[-1][2] += elapsed
+
+    def text(self) -> str:
+        """Строки «стек время_в_мкс» для flamegraph.pl и speedscope."""
+        lines = []
+        for path, seconds in sorted(self.folded.items()):
+            micros = round(seconds * 1e6)
+            if micros > 0:
+                lines.append(f'{path} {micros}')
+        return '\n'.join(lines) + '\n'
+
+
+class QueryLog:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'params': (None if many or REDACTED_TABLES.search(sql)
+                           else params),
+                'ms': round((time.perf_counter() - started) * 1000, 3),
+                'where': [f'{frame.filename}:{frame.lineno} in {frame.name}'
+                          for frame in project_frames()],
+            })
+
+    def explain(self) -> None:
+        """Добавляет к запросам план, не выполняя их повторно."""
+        for query in self.queries:
+            if (query['params'] is not None
+                    and query['sql'].lstrip().upper().startswith(EXPLAINED)):
+                query['plan'] = explain(connections[query['alias']],
+                                        query['sql'], query['params'])
+
+
+def explain(connection, sql, params) -> list:
+    if connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN '
+    else:
+        prefix = 'EXPLAIN '
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            rows = cursor.fetchall()
+    except DatabaseError as error:
+        return [f'EXPLAIN не выполнен: {error}']
+    if connection.vendor == 'sqlite':
+        return [row[-1] for row in rows]
+    return [' '.join(str(column) for column in row) for row in rows]
+
+
+def is_requested(request) -> bool:
+    """Флаг профилирования проверяется до обращения к пользователю."""
+    if not settings.PROFILER_ENABLED:
+        return False
+    if not (request.GET.get(PROFILE_PARAM)
+            or request.META.get(PROFILE_HEADER)):
+        return False
+    return request.user.is_staff
+
+
+class ProfilerMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not is_requested(request):
+            return self.get_response(request)
+        log = QueryLog()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(log))
+            profiler = stack.enter_context(StackProfiler())
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+        with unbudgeted():
+            log.explain()
+            profile = save(request, response, profiler, log, duration)
+        response['X-Profile-Id'] = profile.pk
+        return response
+
+
+def save(request, response, profiler, log, duration):
+    match = request.resolver_match
+    profile = RequestProfile.objects.create(
+        user=request.user,
+        method=request.method,
+        path=request.get_full_path()[:2000],
+        route=match.view_name if match else '',
+        status=response.status_code,
+        duration_ms=round(duration * 1000, 3),
+        sql_count=len(log.queries),
+        sql_ms=round(sum(query['ms'] for query in log.queries), 3),
+        stacks=profiler.text(),
+        queries=json.dumps(log.queries, ensure_ascii=False, indent=2,
+                           default=str),
+    )
+    stale = list(RequestProfile.objects.values_list(
+        'pk', flat=True)[settings.PROFILER_KEEP:])
+    RequestProfile.objects.filter(pk__in=stale).delete()
+    return profile
@@ -0,0 +1,116 @@
+"""Бюджет SQL-запросов на представление.
+
+Представление объявляет максимум запросов декоратором::
+
+    @query_budget(5)
+    def index(request):
+        ...
+
+QueryBudgetMiddleware в режиме отладки и в тестах считает все запросы
+запроса, включая сессию и пользователя, и при превышении бюджета падает
+с исключением. В сообщении запросы сгруппированы по тексту SQL, самые
+частые сверху, со стеком первого вызова: так видно, откуда пришёл N+1.
+Работу, которую в продакшене делает фоновый воркер, но при разработке
+запрос выполняет сам, оборачивают в unbudgeted().
+"""
+import os
+import threading
+import traceback
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+STACK_DEPTH: int = 8
+DB_LAYER = os.path.join('django', 'db', '')
+
+_state = threading.local()
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(max_queries):
+    """Объявляет, сколько SQL-запросов может сделать представление."""
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+@contextmanager
+def unbudgeted():
+    """Запросы внутри блока не входят в бюджет представления."""
+    _state.paused = getattr(_state, 'paused', 0) + 1
+    try:
+        yield
+    finally:
+        _state.paused -= 1
+
+
+def project_frames():
+    """Кадры кода проекта, из которого пришёл запрос в слой БД Django."""
+    frames = traceback.extract_stack()
+    for index, frame in enumerate(frames):
+        if DB_LAYER in frame.filename:
+            frames = frames[:index]
+            break
+    return [
+        frame for frame in frames
+        if frame.filename.startswith(settings.BASE_DIR)
+        and 'site-packages' not in frame.filename
+    ][-STACK_DEPTH:]
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not getattr(_state, 'paused', 0):
+            self.queries.append((sql, project_frames()))
+        return execute(sql, params, many, context)
+
+    def report(self, view_name, budget) -> str:
+        counts = Counter(sql for sql, _ in self.queries)
+        stacks = {}
+        for sql, frames in self.queries:
+            stacks.setdefault(sql, frames)
+        lines = [f'{view_name}: {len(self.queries)} SQL-запросов '
+                 f'при бюджете {budget}']
+        for sql, count in counts.most_common():
+            mark = ' (N+1?)' if count > 1 else ''
+            lines.append(f'\n{count} x{mark} {sql}')
+            lines.extend(
+                f'    {frame.filename}:{frame.lineno} in {frame.name}'
+                for frame in stacks[sql])
+        return '\n'.join(lines)
+
+
+class QueryBudgetMiddleware:
+    """Проверяет бюджеты запросов; включается QUERY_BUDGET_ENABLED."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_BUDGET_ENABLED', settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        budget = getattr(request, 'query_budget', None)
+        if budget is not None and len(recorder.queries) > budget:
+            view_name = getattr(request.resolver_match, 'view_name',
+                                request.path)
+            raise QueryBudgetExceeded(recorder.report(view_name, budget))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, 'query_budget', None)
@@ -0,0 +1,175 @@
+"""Лог медленных SQL-запросов.
+
+Каждый запрос к БД дольше SLOW_QUERY_MS миллисекунд пишется строкой
+JSON в лог core.slow_queries (по умолчанию файл SLOW_QUERY_LOG): отпечаток
+SQL без литералов, место вызова в коде проекта, строка шаблона, который
+его вызвал, пример параметров и план EXPLAIN QUERY PLAN. Параметры
+запросов к сессиям и пользователям не пишутся: там ключи сессий, хеши
+паролей и почта. Команда
+slow_queries складывает записи по отпечатку и показывает, какие запросы
+съедают больше всего времени БД.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.base import Node
+
+from .profiler import EXPLAINED, REDACTED_TABLES, explain
+from .query_budget import project_frames, unbudgeted
+
+
+logger = logging.getLogger(__name__)
+
+PARAMS_SAMPLE: int = 10
+PARAM_LENGTH: int = 80
+
+# Литералы, плейсхолдеры и имена точек сохранения заменяются на ?,
+# списки IN (?, ?, ...) — на IN (...), чтобы запросы с разными
+# значениями дали один отпечаток.
+NORMALIZE = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'"s\d+_x\d+"'), '?'),
+    (re.compile(r'%s|\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\bIN \(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE),
+     'IN (...)'),
+    (re.compile(r'\s+'), ' '),
+)
+
+_local = threading.local()
+
+
+def normalize(sql) -> str:
+    for pattern, replacement in NORMALIZE:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def fingerprint(normalized_sql) -> str:
+    return hashlib.blake2b(normalized_sql.encode(),
+                           digest_size=6).hexdigest()
+
+
+def _where(frame) -> str:
+    path = os.path.relpath(frame.filename, settings.BASE_DIR)
+    return f'{path}:{frame.lineno} in {frame.name}'
+
+
+def template_line():
+    """Шаблон и строка тега, при отрисовке которого выполнен запрос."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        if frame.f_code is Node.render_annotated.__code__:
+            node = frame.f_locals['self']
+            origin = getattr(node, 'origin', None)
+            token = getattr(node, 'token', None)
+            if origin is not None and token is not None:
+                name = origin.template_name or origin.name
+                return f'{name}:{token.lineno}'
+        frame = frame.f_back
+    return None
+
+
+def _sample(sql, params, many):
+    if many or params is None or REDACTED_TABLES.search(sql):
+        return None
+    if isinstance(params, dict):
+        params = list(params.values())
+    return [repr(param)[:PARAM_LENGTH] for param in params[:PARAMS_SAMPLE]]
+
+
+def entry(connection, sql, params, many, duration) -> dict:
+    """Запись лога о медленном запросе."""
+    frames = project_frames()
+    normalized = normalize(sql)
+    plan = None
+    if not many and sql.lstrip().upper().startswith(EXPLAINED):
+        _local.explaining = True
+        try:
+            with unbudgeted():
+                plan = explain(connection, sql, params)
+        finally:
+            _local.explaining = False
+    return {
+        'fingerprint': fingerprint(normalized),
+        'sql': normalized,
+        'ms': round(duration * 1000, 3),
+        'call_site': _where(frames[-1]) if frames else None,
+        'template': template_line(),
+        'stack': [_where(frame) for frame in frames],
+        'params': _sample(sql, params, many),
+        'plan': plan,
+    }
+
+
+def log_slow_query(execute, sql, params, many, context):
+    threshold = settings.SLOW_QUERY_MS
+    if threshold is None or getattr(_local, 'explaining', False):
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration = time.perf_counter() - started
+    if duration * 1000 >= threshold:
+        logger.warning(json.dumps(
+            entry(context['connection'], sql, params, many, duration),
+            ensure_ascii=False, default=str))
+    return result
+
+
+@receiver(connection_created)
+def install(sender, connection, **kwargs):
+    """Подключает лог ко всем соединениям, в том числе вне запросов.
+
+    Обёртка встаёт первой: обёртки middleware снимаются с конца списка.
+    """
+    if log_slow_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, log_slow_query)
+
+
+def aggregate(lines, where=None) -> list:
+    """Записи лога, сложенные по отпечатку, самые дорогие сверху.
+
+    where оставляет запросы, в стеке которых есть этот файл
+    (например, posts/views.py); местом вызова тогда считается он.
+    Доля share считается от времени всех запросов лога.
+    """
+    groups = defaultdict(lambda: {'count': 0, 'total_ms': 0.0,
+                                  'max_ms': 0.0, 'call_sites': Counter(),
+                                  'templates': Counter()})
+    total = 0.0
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        total += record['ms']
+        call_site = record['call_site']
+        if where is not None:
+            matching = [frame for frame in record['stack'] if where in frame]
+            if not matching:
+                continue
+            call_site = matching[-1]
+        group = groups[record['fingerprint']]
+        group['count'] += 1
+        group['total_ms'] += record['ms']
+        group['call_sites'][call_site] += 1
+        if record['template']:
+            group['templates'][record['template']] += 1
+        if record['ms'] >= group['max_ms']:
+            group.update(max_ms=record['ms'], sql=record['sql'],
+                         params=record['params'], plan=record['plan'])
+    result = []
+    for key, group in groups.items():
+        group.update(fingerprint=key,
+                     share=group['total_ms'] / total if total else 0.0)
+        result.append(group)
+    return sorted(result, key=lambda group: group['total_ms'], reverse=True)
@@ -0,0 +1,591 @@
+import json
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Context, Template
+from django.test import (Client, RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.urls import URLResolver, get_resolver, resolve
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from PIL import Image
+
+from posts.benchmark import pick_user
+from posts.models import Comment, Group, Post, Upload, User
+from .logs import PrivateFileHandler
+from .metrics import DROPPED_KEY, SharedCounters, get_store
+from .mmap_cache import MmapCache
+from .models import RequestProfile
+from .query_budget import (QueryBudgetExceeded, QueryBudgetMiddleware,
+                           query_budget)
+from .slow_queries import aggregate, fingerprint, normalize
+
+
+TWO_TIER_CACHES = {
+    'default': {
+        'BACKEND': 'core.cache.TwoTierCache',
+        'LOCATION': 'two-tier-tests',
+        'OPTIONS': {'SHARED': 'shared', 'LOCAL_MAX_ENTRIES': 2},
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'two-tier-tests-shared',
+    },
+}
+
+
+@override_settings(CACHES=TWO_TIER_CACHES)
+class TwoTierCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = caches['default']
+        self.cache.clear()
+
+    def test_local_lru_evicts(self):
+        '''Local tier keeps at most LOCAL_MAX_ENTRIES keys.'''
+        evictions = self.cache.stats()['evictions']
+        for key in ('a', 'b', 'c'):
+            self.cache.set(key, key)
+        self.assertEqual(self.cache.stats()['local_size'], 2)
+        self.assertEqual(self.cache.stats()['evictions'], evictions + 1)
+        self.assertEqual(self.cache.get('a'), 'a')
+
+    def test_stale_value_is_refreshed_once(self):
+        '''Expired value is recomputed by one caller, others get stale.'''
+        self.cache.set('page', 'old', timeout=0.01)
+        time.sleep(0.02)
+        self.assertEqual(self.cache.get('page'), 'old')
+        token = self.cache._acquire('page', None)
+        self.assertIsNotNone(token)
+        self.assertEqual(self.cache.get_or_set('page', lambda: 'new'), 'old')
+        self.cache._release('page', None, token)
+        self.assertEqual(self.cache.get_or_set('page', lambda: 'new'), 'new')
+        self.assertEqual(self.cache.get('page'), 'new')
+
+    def test_plain_get_and_touch_leave_lock_alone(self):
+        '''Only get_or_set takes the rebuild lock; touch never frees it.'''
+        self.cache.set('page', 'old', timeout=0.01)
+        time.sleep(0.02)
+        self.cache.get('page')
+        self.assertIsNotNone(self.cache._acquire('page', None))
+        self.assertTrue(self.cache.touch('page', 30))
+        self.assertIsNone(self.cache._acquire('page', None))
+        self.assertEqual(self.cache.get('page'), 'old')
+
+    def test_only_lock_owner_releases_it(self):
+        '''set() and a stale holder's release keep another worker's lock.'''
+        token = self.cache._acquire('page', None)
+        self.cache.set('page', 'other worker')
+        self.assertIsNone(self.cache._acquire('page', None))
+        self.cache._release('page', None, 'expired-token')
+        self.assertIsNone(self.cache._acquire('page', None))
+        self.cache._release('page', None, token)
+        self.assertIsNotNone(self.cache._acquire('page', None))
+
+    def test_busy_mutex_is_not_taken_over(self):
+        '''A mutex that is not acquired in time raises and stays intact.'''
+        self.cache.set('hits', 0, timeout=60)
+        caches['shared'].add('hits:mutex', 'holder', 60)
+        with mock.patch.object(self.cache, '_lock_timeout', 0.01):
+            with self.assertRaises(TimeoutError):
+                self.cache.incr('hits')
+        self.assertEqual(caches['shared'].get('hits:mutex'), 'holder')
+        self.assertEqual(self.cache.get('hits'), 0)
+
+    def test_incr_of_timed_value_is_atomic(self):
+        '''Concurrent incr of a value with a timeout loses no updates.'''
+        self.cache.set('hits', 0, timeout=60)
+        threads = [threading.Thread(target=_incr_many,
+                                    args=(self.cache, 'hits', 50))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.cache.get('hits'), 200)
+
+    def test_incr_keeps_raw_counters(self):
+        '''Counters without timeout stay incrementable in the shared tier.'''
+        self.cache.set('count', 1, timeout=None)
+        self.assertEqual(self.cache.get('count'), 1)
+        self.cache.incr('count', 2)
+        self.assertEqual(self.cache.get('count'), 3)
+        self.assertEqual(caches['shared'].get('count'), 3)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_raw_values_are_read_from_shared_tier(self):
+        '''Another worker's change to a counter is seen at once.'''
+        self.cache.set('version', 1, timeout=None)
+        self.cache.get('version')
+        caches['shared'].set('version', 2, timeout=None)
+        self.assertEqual(self.cache.get('version'), 2)
+        self.assertEqual(self.cache.stats()['local_size'], 0)
+
+    def test_get_or_set_computes_once(self):
+        '''get_or_set calls the callable only on a miss.'''
+        calls: list = []
+
+        def compute():
+            calls.append(1)
+            return 'value'
+
+        self.assertEqual(self.cache.get_or_set('key', compute), 'value')
+        self.assertEqual(self.cache.get_or_set('key', compute), 'value')
+        self.assertEqual(len(calls), 1)
+
+    def test_get_or_set_waits_for_lock_holder(self):
+        '''Concurrent cold get_or_set waits for the value being computed.'''
+        self.assertIsNotNone(self.cache._acquire('slow', None))
+        timer = threading.Timer(0.1, self.cache.set, ('slow', 'ready'))
+        timer.start()
+        value = self.cache.get_or_set('slow', lambda: 'recomputed')
+        timer.join()
+        self.assertEqual(value, 'ready')
+
+
+class MmapCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = MmapCache(
+            os.path.join(self.directory, 'cache'),
+            {'OPTIONS': {'SLOTS': 16, 'SLOT_SIZE': 256}},
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_set_get_delete(self):
+        '''Basic operations and TTL work on the mapped file.'''
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(self.cache.get('key'), {'value': 1})
+        self.assertFalse(self.cache.add('key', 2))
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+        self.cache.set('short', 1, timeout=0.01)
+        time.sleep(0.02)
+        self.assertFalse(self.cache.has_key('short'))
+        self.cache.set('big', 'x' * 1000)
+        self.assertIsNone(self.cache.get('big'))
+
+    def test_foreign_file_is_refused(self):
+        '''A symlink planted at the cache path is not followed.'''
+        target = os.path.join(self.directory, 'target')
+        open(target, 'wb').close()
+        link = os.path.join(self.directory, 'link')
+        os.symlink(target, link)
+        cache = MmapCache(link, {'OPTIONS': {'SLOTS': 16, 'SLOT_SIZE': 256}})
+        with self.assertRaises(OSError):
+            cache.get('key')
+        self.assertEqual(os.path.getsize(target), 0)
+
+    def test_clear_starts_new_generation(self):
+        '''clear() hides old entries without rewriting the file.'''
+        for i in range(8):
+            self.cache.set(f'key-{i}', i, timeout=None)
+        shared = self.cache._file
+        generation = shared.generation
+        self.cache.clear()
+        self.assertEqual(shared.generation, generation + 1)
+        self.assertFalse(any(self.cache.has_key(f'key-{i}')
+                             for i in range(8)))
+        self.cache.set('key-0', 'new')
+        self.assertEqual(self.cache.get('key-0'), 'new')
+
+    def test_lru_eviction(self):
+        '''A full group evicts its least recently read entry.'''
+        for i in range(200):
+            self.cache.set(f'key-{i}', i)
+            self.cache.get('key-0')
+        self.assertEqual(self.cache.get('key-0'), 0)
+        stored = sum(self.cache.has_key(f'key-{i}') for i in range(200))
+        self.assertLessEqual(stored, 16)
+
+    def test_incr_is_atomic_across_processes(self):
+        '''Workers incrementing one key never lose updates.'''
+        self.cache.set('hits', 0, timeout=None)
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=_incr_many,
+                                   args=(self.cache, 'hits', 200))
+                   for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('hits'), 800)
+
+
+def _incr_many(cache, key, times):
+    for _ in range(times):
+        cache.incr(key)
+
+
+BUDGET_URLCONFS = ('posts.urls', 'users.urls', 'about.urls')
+ROUTE_ARG_RE = re.compile(r'<(?:(\w+):)?(\w+)>')
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def iter_routes(values):
+    """Адреса всех маршрутов BUDGET_URLCONFS с подставленными values.
+
+    Значение ищется сначала по «конвертер:имя», затем по имени.
+    """
+    def fill(match):
+        converter, name = match.groups()
+        return str(values.get(f'{converter}:{name}', values.get(name)))
+
+    for resolver in get_resolver().url_patterns:
+        module = getattr(resolver, 'urlconf_name', None)
+        if (not isinstance(resolver, URLResolver)
+                or getattr(module, '__name__', module)
+                not in BUDGET_URLCONFS):
+            continue
+        for pattern in resolver.url_patterns:
+            route = str(resolver.pattern) + str(pattern.pattern)
+            yield '/' + ROUTE_ARG_RE.sub(fill, route)
+
+
+@override_settings(FEED_FANOUT_THRESHOLD=3, MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class QueryBudgetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        call_command('generate_dataset', '--seed=7', '--users=30',
+                     '--groups=3', '--follows=200', '--posts=300',
+                     '--comments=300', stdout=StringIO())
+        cls.user = pick_user()
+        image = BytesIO()
+        Image.new('RGB', (40, 20), 'red').save(image, 'PNG')
+        cls.post = Post.objects.create(
+            author=cls.user, text='Пост с картинкой',
+            group=Group.objects.first(),
+            image=SimpleUploadedFile('red.png', image.getvalue()),
+        )
+        for author in User.objects.all()[:25]:
+            Comment.objects.create(post=cls.post, author=author,
+                                   text='Комментарий')
+        upload = Upload.objects.create(user=cls.user, filename='a.png',
+                                       size=10, checksum='0' * 64)
+        cls.values = {
+            'post_id': cls.post.pk,
+            'slug': Group.objects.first().slug,
+            'username': User.objects.exclude(pk=cls.user.pk).first(),
+            'uuid:token': upload.token,
+            'uidb64': urlsafe_base64_encode(force_bytes(cls.user.pk)),
+            'token': default_token_generator.make_token(cls.user),
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+
+    def test_every_route_declares_budget_and_fits_it(self):
+        '''Each route has a budget and renders within it with real data.'''
+        urls = list(iter_routes(self.values))
+        self.assertGreater(len(urls), 20)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertIsNotNone(
+                    getattr(resolve(url).func, 'query_budget', None))
+                self.authorized_client.force_login(self.user)
+                self.assertLess(self.authorized_client.get(url).status_code,
+                                500)
+                self.assertLess(Client().get(url).status_code, 500)
+
+    def test_writes_fit_budget(self):
+        '''Posting, editing, commenting and searching stay in budget.'''
+        self.authorized_client.force_login(self.user)
+        image = BytesIO()
+        Image.new('RGB', (30, 30), 'blue').save(image, 'PNG')
+        requests = (
+            ('/create/', {'text': 'Новый пост', 'image': SimpleUploadedFile(
+                'blue.png', image.getvalue())}),
+            (f'/posts/{self.post.pk}/edit/', {'text': 'Новый текст'}),
+            (f'/posts/{self.post.pk}/comment/', {'text': 'Ещё'}),
+        )
+        for url, data in requests:
+            with self.subTest(url=url):
+                response = self.authorized_client.post(url, data)
+                self.assertEqual(response.status_code, 302)
+        response = self.authorized_client.get('/search/', {'q': 'пост'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_n_plus_one_fails_with_stack(self):
+        '''Exceeding the budget raises and points at the repeated query.'''
+        @query_budget(2)
+        def view(request):
+            for post in Post.objects.all()[:3]:
+                post.author.username
+            return None
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            return view(request)
+
+        middleware = QueryBudgetMiddleware(get_response)
+        with self.assertRaises(QueryBudgetExceeded) as raised:
+            middleware(RequestFactory().get('/'))
+        message = str(raised.exception)
+        self.assertIn('3 x (N+1?) SELECT', message)
+        self.assertIn(f'{__file__}:', message)
+
+
+class TimingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_server_timing_header_and_log_line(self):
+        '''Responses carry Server-Timing; the log line names the route.'''
+        user = User.objects.create_user(username='timed')
+        Post.objects.create(author=user, text='Пост')
+        with self.assertLogs('core.timing', 'INFO') as logs:
+            response = self.client.get('/')
+            self.client.get('/')
+        header = response['Server-Timing']
+        self.assertRegex(header, r'db;dur=[\d.]+;desc="\d+"')
+        self.assertRegex(header, r'tpl;dur=[\d.]+;desc="1"')
+        self.assertIn('thumb;dur=', header)
+        self.assertIn('total;dur=', header)
+        first, second = (json.loads(line.split(':', 2)[2])
+                         for line in logs.output)
+        self.assertEqual(first['route'], 'posts:index')
+        self.assertEqual(first['status'], 200)
+        self.assertGreater(first['db_queries'], 0)
+        self.assertGreater(first['cache_misses'], 0)
+        self.assertGreater(second['cache_hits'], 0)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        override = override_settings(
+            METRICS_PATH=os.path.join(directory, 'metrics'))
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_requests_are_exported_by_route(self):
+        '''Histograms, status counters and table gauges are exposed.'''
+        user = User.objects.create_user(username='metered')
+        Post.objects.create(author=user, text='Пост')
+        self.client.get('/')
+        self.client.get('/')
+        self.client.get('/missing/')
+        response = self.client.get('/metrics')
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        text = response.content.decode()
+        self.assertIn('yatube_requests_total{route="posts:index",'
+                      'status="200"} 2.0', text)
+        self.assertIn('yatube_requests_total{route="unmatched",'
+                      'status="404"} 1.0', text)
+        first = text.index('yatube_request_duration_seconds_bucket'
+                           '{route="posts:index",le="0.005"}')
+        last = text.index('yatube_request_duration_seconds_bucket'
+                          '{route="posts:index",le="+Inf"} 2.0')
+        self.assertLess(first, last)
+        self.assertIn('yatube_db_queries_per_request_count'
+                      '{route="posts:index"} 2.0', text)
+        self.assertIn('yatube_cache_hit_ratio{route="posts:index"}', text)
+        self.assertIn('yatube_table_rows{table="posts_post"} 1', text)
+
+    def test_counters_are_shared_between_processes(self):
+        '''Workers on one node add up into the same counters.'''
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=_add_many, args=(get_store(),))
+                   for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(get_store().items(),
+                         {'hits{}': 400.0, DROPPED_KEY: 0.0})
+
+    def test_full_table_counts_dropped_series(self):
+        '''Series that do not fit are counted and logged, not lost silently.'''
+        store = SharedCounters(settings.METRICS_PATH + '-small', 4)
+        with self.assertLogs('core.metrics', 'WARNING'):
+            store.add_many({f'series{{n="{i}"}}': 1 for i in range(10)})
+        values = store.items()
+        self.assertEqual(len(values), 4)
+        self.assertEqual(values[DROPPED_KEY], 7.0)
+
+    def test_symlinked_metrics_file_is_refused(self):
+        '''Metrics are not written through a link planted at their path.'''
+        target = settings.METRICS_PATH + '-target'
+        open(target, 'wb').close()
+        os.symlink(target, settings.METRICS_PATH + '-link')
+        with self.assertRaises(OSError):
+            SharedCounters(settings.METRICS_PATH + '-link', 4)
+        self.assertEqual(os.path.getsize(target), 0)
+
+    def test_metrics_are_not_public(self):
+        '''Only internal addresses or the token holder can scrape.'''
+        self.assertEqual(
+            self.client.get('/metrics', REMOTE_ADDR='10.1.2.3').status_code,
+            403)
+        with self.settings(METRICS_TOKEN='secret'):
+            response = self.client.get('/metrics', REMOTE_ADDR='10.1.2.3',
+                                       HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, 200)
+            response = self.client.get('/metrics', REMOTE_ADDR='10.1.2.3',
+                                       HTTP_AUTHORIZATION='Bearer wrong')
+            self.assertEqual(response.status_code, 403)
+
+
+def _add_many(store):
+    for _ in range(100):
+        store.add_many({'hits{}': 1})
+
+
+class ProfilerTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user(username='staff', is_staff=True,
+                                              is_superuser=True)
+        Post.objects.create(author=self.staff, text='Пост')
+        self.client.force_login(self.staff)
+
+    def test_staff_request_is_profiled(self):
+        '''Profile keeps folded stacks and SQL with query plans.'''
+        response = self.client.get('/?_profile=1')
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual(profile.route, 'posts:index')
+        self.assertEqual(profile.user, self.staff)
+        self.assertIn('posts.views:index', profile.stacks)
+        self.assertRegex(profile.stacks.splitlines()[0], r'^\S.* \d+$')
+        queries = json.loads(profile.queries)
+        self.assertEqual(len(queries), profile.sql_count)
+        selects = [query for query in queries if 'plan' in query]
+        self.assertTrue(selects)
+        self.assertTrue(any('posts/views.py' in where
+                            for query in selects
+                            for where in query['where']))
+
+    def test_user_and_session_params_are_not_stored(self):
+        '''Queries on auth_user and django_session are kept without params.'''
+        response = self.client.get('/profile/staff/?_profile=1')
+        profile = RequestProfile.objects.get(pk=response['X-Profile-Id'])
+        queries = json.loads(profile.queries)
+        private = [query for query in queries
+                   if 'FROM "auth_user" ' in query['sql']
+                   or 'FROM "django_session" ' in query['sql']]
+        self.assertTrue(private)
+        self.assertTrue(all(query['params'] is None for query in private))
+        self.assertTrue(any(query['params'] for query in queries))
+
+    def test_only_staff_can_ask_for_profile(self):
+        '''Flag is ignored for ordinary users and anonymous visitors.'''
+        self.client.get('/', HTTP_X_PROFILE='1')
+        self.assertEqual(RequestProfile.objects.count(), 1)
+        self.client.force_login(User.objects.create_user(username='plain'))
+        response = self.client.get('/?_profile=1')
+        self.assertNotIn('X-Profile-Id', response)
+        self.client.logout()
+        self.client.get('/?_profile=1')
+        self.assertEqual(RequestProfile.objects.count(), 1)
+
+    def test_profile_is_downloaded_from_admin(self):
+        '''Admin serves stacks and queries as attachments.'''
+        pk = self.client.get('/?_profile=1')['X-Profile-Id']
+        change = self.client.get(f'/admin/core/requestprofile/{pk}/change/')
+        self.assertContains(change, f'/admin/core/requestprofile/{pk}/stacks/')
+        response = self.client.get(f'/admin/core/requestprofile/{pk}/stacks/')
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertIn(b'posts.views:index', response.content)
+        response = self.client.get(
+            f'/admin/core/requestprofile/{pk}/queries/')
+        self.assertIsInstance(json.loads(response.content), list)
+
+
+class SlowQueryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='slow')
+        Post.objects.create(author=self.user, text='Пост')
+
+    def test_fingerprint_ignores_literals(self):
+        '''Queries differing only in values share a fingerprint.'''
+        first = normalize("SELECT * FROM t WHERE id IN (%s, %s) AND a = 'x'")
+        second = normalize('SELECT * FROM t\n WHERE id IN (%s) AND a = 10')
+        self.assertEqual(first, 'SELECT * FROM t WHERE id IN (...) AND a = ?')
+        self.assertEqual(fingerprint(first), fingerprint(second))
+        self.assertEqual(normalize('SAVEPOINT "s140118_x12"'), 'SAVEPOINT ?')
+
+    def test_entry_has_call_site_template_and_plan(self):
+        '''Logged query knows its view, template line and query plan.'''
+        with self.settings(SLOW_QUERY_MS=0), \
+                self.assertLogs('core.slow_queries', 'WARNING') as logs:
+            self.client.get('/')
+            Template('{% for user in users %}\n{{ user }}{% endfor %}'
+                     ).render(Context({'users': User.objects.all()}))
+        entries = [json.loads(record.getMessage()) for record in logs.records]
+        from_view = [entry for entry in entries
+                     if any(frame.startswith('posts/views.py:')
+                            for frame in entry['stack'])]
+        self.assertTrue(from_view)
+        self.assertTrue(any(entry['plan'] for entry in from_view))
+        self.assertEqual(entries[-1]['template'], '<unknown source>:1')
+        self.assertIn('"auth_user"', entries[-1]['sql'])
+
+    def test_user_and_session_params_are_dropped(self):
+        '''Parameters of auth_user and django_session queries are not kept.'''
+        with self.settings(SLOW_QUERY_MS=0), \
+                self.assertLogs('core.slow_queries', 'WARNING') as logs:
+            User.objects.filter(email='slow@example.com').exists()
+            Post.objects.filter(text='Пост').exists()
+        entries = [json.loads(record.getMessage()) for record in logs.records]
+        by_table = {'auth_user' if '"auth_user"' in entry['sql']
+                    else 'posts': entry['params'] for entry in entries}
+        self.assertIsNone(by_table['auth_user'])
+        self.assertEqual(by_table['posts'], ["'Пост'"])
+
+    def test_log_file_is_private(self):
+        '''Slow query log is created readable by its owner only.'''
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        handler = PrivateFileHandler(os.path.join(directory, 'logs', 'slow'))
+        handler.emit(logging.makeLogRecord({'msg': '{}'}))
+        handler.close()
+        mode = os.stat(handler.baseFilename).st_mode & 0o777
+        self.assertEqual(mode, 0o600)
+
+    def test_command_aggregates_by_fingerprint(self):
+        '''Report sums time per fingerprint and keeps posts/views.py lines.'''
+        with self.settings(SLOW_QUERY_MS=0), \
+                self.assertLogs('core.slow_queries', 'WARNING') as logs:
+            self.client.get('/')
+            self.client.get('/')
+        with tempfile.NamedTemporaryFile('w', suffix='.log',
+                                         delete=False) as log:
+            log.write('\n'.join(record.getMessage()
+                                for record in logs.records))
+        self.addCleanup(os.remove, log.name)
+        with open(log.name) as lines:
+            groups = aggregate(lines, where='posts/views.py')
+        self.assertTrue(groups)
+        self.assertEqual(len(groups), len({group['fingerprint']
+                                           for group in groups}))
+        self.assertTrue(all(site.startswith('posts/views.py:')
+                            for group in groups
+                            for site in group['call_sites']))
+        self.assertLessEqual(
+            round(sum(group['share'] for group in groups), 6), 1)
+        out = StringIO()
+        call_command('slow_queries', log=log.name, where='posts/views.py',
+                     stdout=out)
+        self.assertIn('вызов: posts/views.py:', out.getvalue())
@@ -0,0 +1,144 @@
+"""Замеры одного запроса: SQL, шаблоны, кэш и миниатюры.
+
+TimingMiddleware отдаёт их в заголовке Server-Timing, пишет строкой
+JSON в лог core.timing вместе с именем маршрута (posts:index, ...) и
+добавляет в общие метрики узла (core.metrics).
+Код, который хочет попасть в замеры, оборачивает работу в timed(name)
+или вызывает count(name): вне запроса оба ничего не делают. Накладные
+расходы — пара вызовов perf_counter на SQL-запрос и шаблон.
+"""
+import json
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+from django.template.backends import django as django_backend
+
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# Метрика Server-Timing: (имя в заголовке, ключ замера).
+SERVER_TIMING = (('db', 'db'), ('tpl', 'template'),
+                 ('thumb', 'thumbnails'))
+
+_local = threading.local()
+
+
+class RequestTimings:
+    def __init__(self):
+        self.durations = defaultdict(float)
+        self.counts = Counter()
+        self.active = set()
+
+
+def current():
+    return getattr(_local, 'timings', None)
+
+
+@contextmanager
+def timed(name):
+    """Добавляет время блока к замеру name; вложенные блоки не удваиваются."""
+    timings = current()
+    if timings is None or name in timings.active:
+        yield
+        return
+    timings.active.add(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.durations[name] += time.perf_counter() - started
+        timings.counts[name] += 1
+        timings.active.discard(name)
+
+
+def count(name, value=1) -> None:
+    timings = current()
+    if timings is not None:
+        timings.counts[name] += value
+
+
+def _timed_execute(execute, sql, params, many, context):
+    with timed('db'):
+        return execute(sql, params, many, context)
+
+
+class Template(django_backend.Template):
+    def render(self, context=None, request=None):
+        with timed('template'):
+            return super().render(context, request)
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """Бэкенд шаблонов Django, время отрисовки которого попадает в замеры."""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return Template(template.template, self)
+
+
+def server_timing(timings, total) -> str:
+    metrics = []
+    for metric, key in SERVER_TIMING:
+        if key in timings.counts:
+            metrics.append(f'{metric};dur={timings.durations[key] * 1000:.1f}'
+                           f';desc="{timings.counts[key]}"')
+    metrics.append(f'cache;desc="hit={timings.counts["cache_hits"]} '
+                   f'miss={timings.counts["cache_misses"]}"')
+    metrics.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(metrics)
+
+
+def route_name(request):
+    match = request.resolver_match
+    return match.view_name if match else None
+
+
+def record(request, response, timings, total) -> dict:
+    """Поля строки лога запроса."""
+    return {
+        'route': route_name(request),
+        'method': request.method,
+        'status': response.status_code,
+        'total_ms': round(total * 1000, 2),
+        'db_ms': round(timings.durations['db'] * 1000, 2),
+        'db_queries': timings.counts['db'],
+        'template_ms': round(timings.durations['template'] * 1000, 2),
+        'cache_hits': timings.counts['cache_hits'],
+        'cache_misses': timings.counts['cache_misses'],
+        'thumbnails_ms': round(timings.durations['thumbnails'] * 1000, 2),
+        'thumbnails_queued': timings.counts['thumbnails_queued'],
+    }
+
+
+class TimingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = _local.timings = RequestTimings()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(_timed_execute))
+                response = self.get_response(request)
+        finally:
+            _local.timings = None
+        total = time.perf_counter() - started
+        response['Server-Timing'] = server_timing(timings, total)
+        metrics.observe_request(route_name(request) or 'unmatched',
+                                response.status_code, total, timings)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(record(request, response, timings,
+                                          total)))
+        return response
@@ -1,6 +1,9 @@
+from django.http import HttpResponse, HttpResponseForbidden
 from django.shortcuts import render
 from http import HTTPStatus
 
+from .metrics import is_allowed, render as render_metrics
+
 
 def page_not_found(request, exception):
     return render(request, 'core/404.html',
@@ -10,3 +13,11 @@ def page_not_found(request, exception):
 def forbidden(request, reason=''):
     return render(request, 'core/403csrf.html',
                   status=HTTPStatus.FORBIDDEN)
+
+
+def metrics(request):
+    if not is_allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render_metrics(),
+                        content_type='text/plain; version=0.0.4; '
+                                     'charset=utf-8')
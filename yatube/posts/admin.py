@@ -1,6 +1,12 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR
+from django.db.models import Case, IntegerField, When
 
 from .models import Post, Group, Comment
+from .search import SearchResults
+
+# Сколько лучших совпадений поиска показывает список постов в админке.
+ADMIN_SEARCH_LIMIT: int = 1000
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -16,6 +22,21 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        ids = SearchResults(search_term).ids(0, ADMIN_SEARCH_LIMIT)
+        if not ids:
+            return queryset.none(), False
+        rank = Case(*(When(pk=pk, then=position)
+                      for position, pk in enumerate(ids)),
+                    output_field=IntegerField())
+        queryset = queryset.filter(pk__in=ids).annotate(search_rank=rank)
+        if ORDER_VAR not in request.GET:
+            # Без выбранной сортировки — по релевантности.
+            queryset = queryset.order_by('search_rank', '-pk')
+        return queryset, False
+
 
 class CommentAdmin(admin.ModelAdmin):
     list_display = ('pk', 'text',
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class PostsConfig(AppConfig):
     name: str = 'posts'
     verbose_name: str = 'managing posts'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,242 @@
+"""Бенчмарк основных страниц через тестовый клиент Django.
+
+Запросы идут к текущей базе, например после generate_dataset. Для каждой
+страницы считаются перцентили времени ответа, число SQL-запросов и строк,
+которые база отдала приложению. На SQLite дополнительно считаются шаги
+виртуальной машины: в отличие от строк, они растут и от полного
+просмотра таблицы, а в отличие от времени, почти не шумят. Изменяющие
+запросы выполняются в транзакции с откатом, поэтому данные между
+прогонами не меняются.
+"""
+import math
+import statistics
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.backends.utils import CursorWrapper
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Comment, Group, Post, User, UserStats
+
+
+VIEWS = ('index', 'group_posts', 'profile', 'post_detail', 'follow_index',
+         'post_create', 'add_comment')
+LATENCY_KEYS = ('p50_ms', 'p95_ms')
+# Меньшие расхождения времени считаем шумом даже при малой базе.
+MIN_DELTA_MS = 1.0
+# Как часто SQLite вызывает обработчик прогресса, в шагах VM.
+VM_STEP: int = 1000
+
+Scenario = namedtuple('Scenario', ('name', 'method', 'url', 'data'))
+
+
+class Meter:
+    def __init__(self):
+        self.queries = 0
+        self.rows = 0
+        self.vm_steps = 0
+
+
+class CountingCursor(CursorWrapper):
+    """Курсор, считающий выполненные запросы и полученные строки."""
+
+    def __init__(self, cursor, db, meter):
+        super().__init__(cursor, db)
+        self.meter = meter
+
+    def execute(self, sql, params=None):
+        self.meter.queries += 1
+        return super().execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        self.meter.queries += 1
+        return super().executemany(sql, param_list)
+
+    def fetchone(self):
+        with self.db.wrap_database_errors:
+            row = self.cursor.fetchone()
+        if row is not None:
+            self.meter.rows += 1
+        return row
+
+    def fetchmany(self, *args):
+        with self.db.wrap_database_errors:
+            rows = self.cursor.fetchmany(*args)
+        self.meter.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        with self.db.wrap_database_errors:
+            rows = self.cursor.fetchall()
+        self.meter.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        with self.db.wrap_database_errors:
+            for row in self.cursor:
+                self.meter.rows += 1
+                yield row
+
+
+@contextmanager
+def metered():
+    """Считает запросы и строки всех курсоров соединения внутри блока."""
+    meter = Meter()
+
+    def make_cursor(cursor):
+        return CountingCursor(cursor, connection, meter)
+
+    def progress():
+        meter.vm_steps += VM_STEP
+        return 0
+
+    connection.make_cursor = connection.make_debug_cursor = make_cursor
+    sqlite = connection.vendor == 'sqlite'
+    if sqlite:
+        connection.ensure_connection()
+        connection.connection.set_progress_handler(progress, VM_STEP)
+    try:
+        yield meter
+    finally:
+        del connection.make_cursor, connection.make_debug_cursor
+        if sqlite and connection.connection is not None:
+            connection.connection.set_progress_handler(None, 0)
+
+
+def percentile(values, q) -> float:
+    """Перцентиль по методу ближайшего ранга."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q / 100 * len(ordered)) - 1, 0)]
+
+
+def pick_user():
+    """Пользователь с самой большой лентой подписок."""
+    stats = UserStats.objects.order_by('-following_count').first()
+    if stats is not None:
+        return stats.user
+    return User.objects.order_by('pk').first()
+
+
+def scenarios(views=VIEWS) -> list:
+    """Запросы к самым нагруженным группе, автору и посту базы."""
+    group = (Group.objects.annotate(total=Count('posts'))
+             .order_by('-total').first())
+    author = (UserStats.objects.select_related('user')
+              .order_by('-posts_count').first())
+    post = Post.objects.order_by('-comment_count', '-pk').first()
+    available = {
+        'index': Scenario('index', 'get', reverse('posts:index'), None),
+        'follow_index': Scenario(
+            'follow_index', 'get', reverse('posts:follow_index'), None),
+        'post_create': Scenario(
+            'post_create', 'post', reverse('posts:post_create'),
+            {'text': 'Пост из бенчмарка'}),
+    }
+    if group is not None:
+        available['group_posts'] = Scenario(
+            'group_posts', 'get',
+            reverse('posts:group_list', args=(group.slug,)), None)
+    if author is not None:
+        available['profile'] = Scenario(
+            'profile', 'get',
+            reverse('posts:profile', args=(author.user.username,)), None)
+    if post is not None:
+        available['post_detail'] = Scenario(
+            'post_detail', 'get',
+            reverse('posts:post_detail', args=(post.pk,)), None)
+        available['add_comment'] = Scenario(
+            'add_comment', 'post',
+            reverse('posts:add_comment', args=(post.pk,)),
+            {'text': 'Комментарий из бенчмарка'})
+    return [available[name] for name in views if name in available]
+
+
+def run_scenario(client, scenario, iterations, warmup=0, cold=False) -> dict:
+    timings, statuses = [], set()
+    counts = {'queries': [], 'rows': [], 'vm_steps': []}
+    for iteration in range(warmup + iterations):
+        if cold:
+            cache.clear()
+        with transaction.atomic(), metered() as meter:
+            started = time.perf_counter()
+            response = getattr(client, scenario.method)(
+                scenario.url, scenario.data)
+            elapsed = time.perf_counter() - started
+            transaction.set_rollback(True)
+        if iteration < warmup:
+            continue
+        timings.append(elapsed * 1000)
+        for key, values in counts.items():
+            values.append(getattr(meter, key))
+        statuses.add(response.status_code)
+    result = {
+        'url': scenario.url,
+        'method': scenario.method.upper(),
+        'status': sorted(statuses),
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'mean_ms': round(statistics.mean(timings), 3),
+    }
+    for key, values in counts.items():
+        result[key] = statistics.median_low(values)
+    return result
+
+
+def run(iterations=100, warmup=5, views=VIEWS, cold=False, user=None,
+        log=None) -> dict:
+    log = log or (lambda message: None)
+    user = user or pick_user()
+    if user is None:
+        raise ValueError('В базе нет пользователей')
+    client = Client()
+    client.force_login(user)
+    results = {}
+    for scenario in scenarios(views):
+        log(f'{scenario.name}: {scenario.method.upper()} {scenario.url}')
+        results[scenario.name] = run_scenario(client, scenario, iterations,
+                                              warmup, cold)
+    return {
+        'created': timezone.now().isoformat(),
+        'iterations': iterations,
+        'warmup': warmup,
+        'cache': 'cold' if cold else 'warm',
+        'user': user.username,
+        'dataset': {
+            'users': User.objects.count(),
+            'posts': Post.objects.count(),
+            'comments': Comment.objects.count(),
+        },
+        'views': results,
+    }
+
+
+def compare(results, baseline, tolerance=0.2) -> list:
+    """Регрессии относительно baseline: время, запросы, строки, статусы."""
+    regressions = []
+    for name, current in results['views'].items():
+        old = baseline.get('views', {}).get(name)
+        if old is None:
+            continue
+        if current['status'] != old['status']:
+            regressions.append(
+                f'{name}: статус {old["status"]} -> {current["status"]}')
+        for key in LATENCY_KEYS:
+            limit = max(old[key] * (1 + tolerance), old[key] + MIN_DELTA_MS)
+            if current[key] > limit:
+                regressions.append(
+                    f'{name}: {key} {old[key]} -> {current[key]}')
+        if current['queries'] > old['queries']:
+            regressions.append(
+                f'{name}: запросов {old["queries"]} -> {current["queries"]}')
+        for key in ('rows', 'vm_steps'):
+            if current[key] > old.get(key, 0) * (1 + tolerance):
+                regressions.append(
+                    f'{name}: {key} {old.get(key, 0)} -> {current[key]}')
+    return regressions
@@ -0,0 +1,77 @@
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import Group, Post, User
+
+
+COUNT_KEY_PREFIX = 'posts:count'
+
+
+def count_key(group_id=None, author_id=None) -> str:
+    """Ключ кэша с числом постов ленты: общей, группы или автора."""
+    if group_id is not None:
+        return f'{COUNT_KEY_PREFIX}:group:{group_id}'
+    if author_id is not None:
+        return f'{COUNT_KEY_PREFIX}:author:{author_id}'
+    return f'{COUNT_KEY_PREFIX}:all'
+
+
+def post_count_keys(group_id, author_id) -> list:
+    """Ключи всех лент, в которые попадает пост."""
+    keys = [count_key(), count_key(author_id=author_id)]
+    if group_id is not None:
+        keys.append(count_key(group_id=group_id))
+    return keys
+
+
+def get_count(key, queryset) -> int:
+    """Число постов из кэша; при промахе считает COUNT(*) один раз."""
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, timeout=None)
+    return count
+
+
+def total_count() -> int:
+    """Число всех постов из кэшированного счётчика общей ленты.
+
+    Общая лента и лента подписок листаются по курсору и постов не
+    считают; счётчик читает метрика yatube_table_rows
+    (METRICS_TABLE_GAUGES).
+    """
+    return get_count(count_key(), Post.objects.all())
+
+
+def change_counts(keys, delta) -> None:
+    """Сдвигает счётчики; отсутствующие ключи досчитаются при чтении."""
+    for key in keys:
+        try:
+            cache.incr(key, delta)
+        except ValueError:
+            pass
+
+
+def invalidate(keys) -> None:
+    cache.delete_many(keys)
+
+
+def reconcile(batch_size=1000) -> int:
+    """Пересчитывает все счётчики из базы, исправляя накопленный дрейф."""
+    cache.set(count_key(), Post.objects.count(), timeout=None)
+    total = 1
+    for field, model in (('group_id', Group), ('author_id', User)):
+        counts = dict(
+            Post.objects.order_by().exclude(**{field: None})
+            .values_list(field).annotate(total=Count('id'))
+        )
+        batch: dict = {}
+        for pk in model.objects.values_list('pk', flat=True).iterator():
+            batch[count_key(**{field: pk})] = counts.get(pk, 0)
+            if len(batch) >= batch_size:
+                cache.set_many(batch, timeout=None)
+                total += len(batch)
+                batch = {}
+        cache.set_many(batch, timeout=None)
+        total += len(batch)
+    return total
@@ -0,0 +1,258 @@
+"""Генератор большого правдоподобного набора данных для бенчмарков.
+
+Подписчики и активность авторов распределены по степенному закону,
+у групп и постов есть «горячие» лидеры, а посты идут всплесками.
+Один и тот же seed даёт один и тот же набор.
+"""
+import bisect
+import random
+from datetime import timedelta
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+from django.db.models import Max
+from django.utils import timezone
+from faker import Faker
+
+from . import counters, search, stats, versions
+from .models import Comment, FeedEntry, Follow, Group, Post, User
+
+
+ZIPF_ALPHA = 1.1
+TEXT_POOL_SIZE: int = 2000
+# Сколько постов в среднем приходится на один всплеск публикаций.
+POSTS_PER_BURST: int = 200
+BURST_SECONDS: int = 3 * 3600
+
+
+class DatasetExists(Exception):
+    pass
+
+
+def zipf_cum_weights(size, alpha=ZIPF_ALPHA) -> list:
+    return list(accumulate(1 / rank ** alpha for rank in range(1, size + 1)))
+
+
+class Picker:
+    """Быстрый выбор индекса по накопленным весам."""
+
+    def __init__(self, rng, cum_weights, values=None):
+        if not cum_weights:
+            raise ValueError('Picker: не из чего выбирать')
+        self.rng = rng
+        self.cum_weights = cum_weights
+        self.total = cum_weights[-1]
+        self.values = values
+
+    def __call__(self):
+        index = bisect.bisect(self.cum_weights, self.rng.random() * self.total)
+        index = min(index, len(self.cum_weights) - 1)
+        return index if self.values is None else self.values[index]
+
+
+def _next_id(model) -> int:
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def _insert(model, fields, rows, batch_size):
+    """Вставляет кортежи rows в поля fields через executemany.
+
+    ORM-объекты и компилятор запросов на миллионах строк заметно
+    медленнее; остальные поля модели получают значения по умолчанию.
+    """
+    opts = model._meta
+    given = [opts.get_field(name) for name in fields]
+    names = {field.attname for field in given}
+    rest = [field for field in opts.concrete_fields
+            if field.attname not in names
+            and not isinstance(field, models.AutoField)]
+    defaults = tuple(field.get_db_prep_save(field.get_default(), connection)
+                     for field in rest)
+    dates = [index for index, field in enumerate(given)
+             if isinstance(field, models.DateTimeField)]
+    quote = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(opts.db_table),
+        ', '.join(quote(field.column) for field in given + rest),
+        ', '.join(['%s'] * (len(given) + len(rest))),
+    )
+    adapt = connection.ops.adapt_datetimefield_value
+
+    def flush(batch):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, batch)
+
+    batch = []
+    for row in rows:
+        if dates:
+            row = list(row)
+            for index in dates:
+                row[index] = adapt(row[index])
+        batch.append(tuple(row) + defaults)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+
+class Generator:
+    def __init__(self, seed, batch_size=10000, days=365, log=None):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.faker = Faker('ru_RU')
+        self.faker.seed_instance(seed)
+        self.batch_size = batch_size
+        self.days = days
+        self.log = log or (lambda message: None)
+        self.prefix = f'gen{seed}_'
+
+    def text(self, min_sentences=1, max_sentences=4) -> str:
+        count = self.rng.randint(min_sentences, max_sentences)
+        return ' '.join(self.rng.choice(self.texts) for _ in range(count))
+
+    def run(self, users, groups, posts, comments, follows, feeds=True):
+        if User.objects.filter(username=f'{self.prefix}0').exists():
+            raise DatasetExists(f'Набор с seed={self.seed} уже загружен')
+        self.texts = [self.faker.sentence(nb_words=12)
+                      for _ in range(TEXT_POOL_SIZE)]
+        self.now = timezone.now()
+        user_ids = self.create_users(users)
+        group_ids = self.create_groups(groups)
+        followers = self.create_follows(user_ids, follows)
+        first_post = self.create_posts(user_ids, group_ids, followers,
+                                       posts, comments)
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(
+                    no_style(), [User, Group, Post]):
+                cursor.execute(sql)
+        self.log('Служебные данные...')
+        new_posts = Post.objects.filter(pk__gte=first_post)
+        if feeds:
+            self.fill_feeds(first_post)
+        search.index_new_posts(new_posts, self.batch_size)
+        stats.recompute(batch_size=self.batch_size)
+        counters.reconcile()
+        versions.bump([versions.version_key('all')])
+
+    def create_users(self, count) -> list:
+        self.log(f'Пользователи: {count}')
+        first_id = _next_id(User)
+        password = make_password(None)
+        _insert(User, ('id', 'username', 'first_name', 'last_name',
+                       'password', 'date_joined'), (
+            (first_id + i, f'{self.prefix}{i}', self.faker.first_name(),
+             self.faker.last_name(), password, self.now)
+            for i in range(count)
+        ), self.batch_size)
+        return list(range(first_id, first_id + count))
+
+    def create_groups(self, count) -> list:
+        self.log(f'Группы: {count}')
+        first_id = _next_id(Group)
+        _insert(Group, ('id', 'title', 'slug', 'description'), (
+            (first_id + i, self.faker.catch_phrase()[:200],
+             f'{self.prefix}{i}'.replace('_', '-'), self.text())
+            for i in range(count)
+        ), self.batch_size)
+        return list(range(first_id, first_id + count))
+
+    def create_follows(self, user_ids, count) -> dict:
+        """Подписки на авторов по Ципфу; возвращает число подписчиков."""
+        self.log(f'Подписки: {count}')
+        authors = user_ids[:]
+        self.rng.shuffle(authors)
+        pick_author = Picker(self.rng, zipf_cum_weights(len(authors)),
+                             authors)
+        # Пара (подписчик, автор) хранится одним числом: так меньше памяти.
+        base = user_ids[-1] + 1
+        pairs = set()
+        attempts = 0
+        while len(pairs) < count and attempts < count * 3:
+            attempts += 1
+            user_id = self.rng.choice(user_ids)
+            author_id = pick_author()
+            if user_id != author_id:
+                pairs.add(user_id * base + author_id)
+        followers = dict.fromkeys(user_ids, 0)
+
+        def follows():
+            for pair in sorted(pairs):
+                user_id, author_id = divmod(pair, base)
+                followers[author_id] += 1
+                yield user_id, author_id
+
+        _insert(Follow, ('user', 'author'), follows(), self.batch_size)
+        return followers
+
+    def post_dates(self, count):
+        """Даты постов всплесками вокруг случайных моментов периода."""
+        bursts = max(count // POSTS_PER_BURST, 1)
+        period = self.days * 24 * 3600
+        centers = [self.rng.uniform(0, period) for _ in range(bursts)]
+        pick_burst = Picker(self.rng, zipf_cum_weights(bursts), centers)
+        for _ in range(count):
+            ago = pick_burst() - self.rng.expovariate(1 / BURST_SECONDS)
+            yield self.now - timedelta(seconds=max(ago, 0))
+
+    def create_posts(self, user_ids, group_ids, followers, count,
+                     comment_total) -> int:
+        self.log(f'Посты: {count}, комментарии: {comment_total}')
+        authors = user_ids[:]
+        self.rng.shuffle(authors)
+        pick_author = Picker(self.rng, zipf_cum_weights(len(authors)),
+                             authors)
+        pick_group = (Picker(self.rng, zipf_cum_weights(len(group_ids)),
+                             group_ids) if group_ids else None)
+        pick_commenter = Picker(self.rng, zipf_cum_weights(len(authors)),
+                                authors)
+        # Комментарии тоже собираются у немногих «горячих» постов.
+        comment_counts = [0] * count
+        if count:
+            pick_post = Picker(self.rng, zipf_cum_weights(count))
+            for _ in range(comment_total):
+                comment_counts[pick_post()] += 1
+        threshold = settings.FEED_FANOUT_THRESHOLD
+        first_id = _next_id(Post)
+        dates = []
+
+        def posts():
+            for i, pub_date in enumerate(self.post_dates(count)):
+                author_id = pick_author()
+                dates.append(pub_date)
+                group_id = (pick_group() if pick_group
+                            and self.rng.random() < 0.7 else None)
+                yield (first_id + i, self.text(), author_id, group_id,
+                       pub_date, followers[author_id] > threshold,
+                       comment_counts[i])
+
+        def comments():
+            for i, total in enumerate(comment_counts):
+                for _ in range(total):
+                    created = dates[i] + timedelta(
+                        seconds=self.rng.expovariate(1 / 3600))
+                    yield (first_id + i, pick_commenter(),
+                           self.text(1, 2), min(created, self.now))
+
+        _insert(Post, ('id', 'text', 'author', 'group', 'pub_date',
+                       'pulled', 'comment_count'), posts(), self.batch_size)
+        _insert(Comment, ('post', 'author', 'text', 'created'), comments(),
+                self.batch_size)
+        return first_id
+
+    def fill_feeds(self, first_post):
+        """Раскладывает новые посты по лентам одним INSERT ... SELECT."""
+        self.log('Ленты подписок...')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {FeedEntry._meta.db_table} '
+                '(user_id, post_id, pub_date) '
+                'SELECT f.user_id, p.id, p.pub_date '
+                f'FROM {Follow._meta.db_table} f '
+                f'JOIN {Post._meta.db_table} p ON p.author_id = f.author_id '
+                'WHERE p.pulled = %s AND p.id >= %s',
+                [False, first_post],
+            )
@@ -0,0 +1,190 @@
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.core.paginator import Page
+from django.db.models import Exists, OuterRef, Q
+
+from .models import FeedEntry, Follow, Post, UserStats
+from .utils import NUMBER_OF_POSTS, KeysetPaginator
+
+
+# Сколько последних постов автора попадает в ленту при подписке.
+FEED_BACKFILL_SIZE: int = 1000
+FEED_BATCH_SIZE: int = 1000
+# Сколько популярных авторов выбирается одним запросом: каждый автор
+# добавляет в условие ветку OR, а глубина выражения в SQLite не больше 1000.
+PULL_BATCH_SIZE: int = 500
+
+
+def should_pull(author_id) -> bool:
+    """Слишком популярного автора не раскладываем по лентам."""
+    followers = (UserStats.objects.filter(user_id=author_id)
+                 .values_list('followers_count', flat=True).first())
+    return (followers or 0) > settings.FEED_FANOUT_THRESHOLD
+
+
+def fan_out(post) -> None:
+    """Раскладывает новый пост в ленты всех подписчиков автора."""
+    if post.pulled:
+        return
+    followers = (Follow.objects.filter(author_id=post.author_id)
+                 .values_list('user_id', flat=True))
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+         for user_id in followers.iterator()),
+        batch_size=FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user_id, author_id) -> None:
+    """Добавляет в ленту подписчика последние посты автора."""
+    posts = (Post.objects.filter(author_id=author_id, pulled=False)
+             .order_by('-pub_date', '-id')
+             .values_list('id', 'pub_date')[:FEED_BACKFILL_SIZE])
+    FeedEntry.objects.bulk_create(
+        (FeedEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts),
+        batch_size=FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def trim(user_id, author_id) -> None:
+    """Убирает из ленты бывшего подписчика посты автора."""
+    FeedEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id,
+    ).delete()
+
+
+def _sort_key(post):
+    return post.pub_date, post.pk
+
+
+def _seek(key, newer, date_field, pk_field):
+    """Условие «строго новее/старше позиции key» по (дата, id)."""
+    date, pk = key
+    op = 'gt' if newer else 'lt'
+    return (Q(**{f'{date_field}__{op}': date})
+            | Q(**{date_field: date, f'{pk_field}__{op}': pk}))
+
+
+class HybridFeed:
+    """Лента подписок: разложенные записи плюс посты популярных авторов.
+
+    Записи из FeedEntry и свежие посты популярных авторов уже
+    отсортированы по (pub_date, id), поэтому страница собирается слиянием
+    списков. Каждый источник читается от позиции курсора и не больше
+    одной страницы: глубина листания не влияет на число строк. Посты
+    популярных авторов берутся одним запросом на каждые PULL_BATCH_SIZE
+    авторов.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.entries = FeedEntry.objects.filter(user=user).select_related(
+            'post__author', 'post__group')
+        self.pulled_authors = list(
+            Follow.objects.filter(user=user).order_by()
+            .annotate(has_pulled=Exists(Post.objects.filter(
+                author_id=OuterRef('author_id'), pulled=True)))
+            .filter(has_pulled=True)
+            .values_list('author_id', flat=True)
+        )
+
+    def _pushed_posts(self, key, limit, newer):
+        entries = self.entries
+        if key is not None:
+            entries = entries.filter(_seek(key, newer, 'pub_date', 'post_id'))
+        order = ('pub_date', 'post_id') if newer else ('-pub_date', '-post_id')
+        return [entry.post for entry in entries.order_by(*order)[:limit]]
+
+    def _pulled_posts(self, author_ids, key, limit, newer):
+        """Первые limit постов этих авторов от позиции key одним запросом."""
+        posts = Post.objects.filter(pulled=True)
+        if key is not None:
+            posts = posts.filter(_seek(key, newer, 'pub_date', 'pk'))
+        order = ('pub_date', 'id') if newer else ('-pub_date', '-id')
+        latest = Q()
+        for author_id in author_ids:
+            latest |= Q(pk__in=posts.filter(author_id=author_id)
+                        .order_by(*order).values('pk')[:limit])
+        return Post.objects.filter(latest).select_related(
+            'author', 'group').order_by(*order)[:limit]
+
+    def seek(self, key, limit, newer=False) -> list:
+        """До limit постов старше key (newer — новее, ближайшие первыми).
+
+        Без key — самые новые посты ленты.
+        """
+        sources = [self._pushed_posts(key, limit, newer)]
+        sources.extend(
+            self._pulled_posts(self.pulled_authors[batch:batch
+                                                   + PULL_BATCH_SIZE],
+                               key, limit, newer)
+            for batch in range(0, len(self.pulled_authors), PULL_BATCH_SIZE)
+        )
+        merged = heapq.merge(*sources, key=_sort_key, reverse=not newer)
+        return list(islice(merged, limit))
+
+    def count(self) -> int:
+        count = self.entries.count()
+        if self.pulled_authors:
+            count += Post.objects.filter(
+                author_id__in=Follow.objects.filter(
+                    user=self.user).values('author_id'),
+                pulled=True,
+            ).count()
+        return count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        if not self.pulled_authors:
+            return [entry.post for entry in self.entries[start:stop]]
+        return self.seek(None, stop)[start:stop]
+
+
+class FeedPaginator(KeysetPaginator):
+    """Курсорная пагинация ленты: соседние посты берутся из HybridFeed.seek.
+
+    Страница ленты — обычный Page. Пагинатор создаётся на один запрос,
+    поэтому num_pages описывает только соседей этой страницы: номер 1 у
+    первой страницы и 2 у остальных, так has_next/has_previous обходятся
+    без COUNT(*). Курсоры и ключ кэша берутся из KeysetPage.
+    """
+
+    def __init__(self, user, per_page):
+        super().__init__(HybridFeed(user), per_page)
+
+    def _older(self, key, limit) -> list:
+        return self.object_list.seek(key, limit)
+
+    def _newer(self, key, limit) -> list:
+        return self.object_list.seek(key, limit, newer=True)
+
+    def get_page(self, number=None, after=None, before=None):
+        if number is not None and after is None and before is None:
+            return super().get_page(number)
+        keyset_page = super().get_page(after=after, before=before)
+        number = 2 if keyset_page.has_previous() else 1
+        self.num_pages = number + keyset_page.has_next()
+        page = Page(keyset_page.object_list, number, self)
+        page.next_cursor = keyset_page.next_cursor
+        page.previous_cursor = keyset_page.previous_cursor
+        page.cache_key = keyset_page.cache_key
+        return page
+
+
+def feed_page(user, request):
+    """Страница ленты подписок без OFFSET и COUNT(*)."""
+    paginator = FeedPaginator(user, NUMBER_OF_POSTS)
+    return paginator.get_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
@@ -1,5 +1,7 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
+from . import images
 from .models import Post, Comment, Follow
 
 
@@ -20,6 +22,19 @@ class PostForm(forms.ModelForm):
             'Загрузите изображение',
         }
 
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        if isinstance(image, UploadedFile):
+            return images.normalize(image)
+        return image
+
+    def save(self, commit=True):
+        if 'image' in self.changed_data:
+            for field, value in images.describe(
+                    self.cleaned_data['image']).items():
+                setattr(self.instance, field, value)
+        return super().save(commit)
+
 
 class CommentForm(forms.ModelForm):
 
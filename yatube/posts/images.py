@@ -0,0 +1,72 @@
+import base64
+import os
+from io import BytesIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image, ImageOps
+
+
+# Большая сторона загруженной картинки после нормализации.
+MAX_IMAGE_SIDE: int = 2048
+# Форматы, которые пересохраняются без метаданных; GIF не трогаем,
+# чтобы не потерять анимацию.
+SAVE_OPTIONS = {
+    'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+    'WEBP': {'quality': 80, 'method': 6},
+}
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+# Ширина размытого превью, которое встраивается в страницу.
+LQIP_WIDTH: int = 16
+
+
+def normalize(uploaded):
+    """Поворачивает по EXIF, ограничивает размер и убирает метаданные.
+
+    Цветовой профиль сохраняется, остальные метаданные (EXIF, GPS)
+    отбрасываются при пересохранении.
+    """
+    image = Image.open(uploaded)
+    image_format = 'JPEG' if image.format == 'MPO' else image.format
+    if image_format not in SAVE_OPTIONS:
+        uploaded.seek(0)
+        return uploaded
+    icc_profile = image.info.get('icc_profile')
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE), Image.LANCZOS)
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    options = dict(SAVE_OPTIONS[image_format])
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    buffer = BytesIO()
+    image.save(buffer, image_format, **options)
+    name = (os.path.splitext(os.path.basename(uploaded.name))[0]
+            + '.' + EXTENSIONS[image_format])
+    return SimpleUploadedFile(name, buffer.getvalue(),
+                              Image.MIME[image_format])
+
+
+def describe(file_) -> dict:
+    """Поля Post с размерами, средним цветом и превью картинки."""
+    if not file_:
+        return {'image_width': None, 'image_height': None,
+                'image_color': '', 'image_lqip': ''}
+    file_.seek(0)
+    with Image.open(file_) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+    file_.seek(0)
+    red, green, blue = image.resize((1, 1), Image.BOX).getpixel((0, 0))
+    preview = image.resize(
+        (LQIP_WIDTH, max(round(LQIP_WIDTH * image.height / image.width), 1)),
+        Image.BOX,
+    )
+    buffer = BytesIO()
+    preview.save(buffer, 'JPEG', quality=40)
+    return {
+        'image_width': image.width,
+        'image_height': image.height,
+        'image_color': f'#{red:02x}{green:02x}{blue:02x}',
+        'image_lqip': ('data:image/jpeg;base64,'
+                       + base64.b64encode(buffer.getvalue()).decode()),
+    }
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from posts import images
+from posts.models import Post
+
+
+FIELDS = ('image_width', 'image_height', 'image_color', 'image_lqip')
+
+
+class Command(BaseCommand):
+    help = 'Заполняет размеры, цвет и превью картинок старых постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        posts = (Post.objects.exclude(image='')
+                 .filter(image_width__isnull=True)
+                 .order_by('pk').only('pk', 'image'))
+        filled = failed = 0
+        last_pk = 0
+        while True:
+            batch = list(posts.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not batch:
+                break
+            ready = []
+            for post in batch:
+                try:
+                    with post.image.open('rb') as file_:
+                        info = images.describe(file_)
+                except (OSError, ValueError) as error:
+                    failed += 1
+                    self.stderr.write(f'{post.image.name}: {error}')
+                    continue
+                for field, value in info.items():
+                    setattr(post, field, value)
+                ready.append(post)
+            Post.objects.bulk_update(ready, FIELDS)
+            filled += len(ready)
+            last_pk = batch[-1].pk
+        self.stdout.write(
+            f'Заполнены данные картинок: {filled}, ошибок: {failed}')
@@ -0,0 +1,73 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import benchmark
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = ('Замеряет время ответа, число SQL-запросов и строк основных '
+            'страниц и сравнивает их с сохранённым baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=100)
+        parser.add_argument('--warmup', type=int, default=5,
+                            help='Сколько первых запросов не учитывать.')
+        parser.add_argument('--views', nargs='+', choices=benchmark.VIEWS,
+                            default=benchmark.VIEWS)
+        parser.add_argument('--cold', action='store_true',
+                            help='Очищать кэш перед каждым запросом.')
+        parser.add_argument('--username',
+                            help='От чьего имени ходить по страницам.')
+        parser.add_argument('--output', help='Сохранить результат в JSON.')
+        parser.add_argument('--baseline',
+                            help='JSON прошлого прогона для сравнения.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Допустимый рост времени и строк, доля.')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('Нужна хотя бы одна итерация')
+        if settings.DEBUG:
+            self.stderr.write('DEBUG включён: время ответа будет завышено')
+        user = None
+        if options['username']:
+            user = User.objects.filter(username=options['username']).first()
+            if user is None:
+                raise CommandError('Нет такого пользователя')
+        try:
+            results = benchmark.run(
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                views=options['views'],
+                cold=options['cold'],
+                user=user,
+                log=self.stdout.write if options['verbosity'] > 1 else None,
+            )
+        except ValueError as error:
+            raise CommandError(error)
+        self.report(results)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, ensure_ascii=False, indent=2)
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['tolerance'])
+
+    def report(self, results):
+        for name, row in results['views'].items():
+            self.stdout.write(
+                f'{name:<14} p50 {row["p50_ms"]:>8.2f} '
+                f'p95 {row["p95_ms"]:>8.2f} p99 {row["p99_ms"]:>8.2f} мс  '
+                f'запросов {row["queries"]:>3}  строк {row["rows"]:>6}  '
+                f'шагов VM {row["vm_steps"]:>9}'
+            )
+
+    def compare(self, results, path, tolerance):
+        with open(path) as baseline:
+            regressions = benchmark.compare(results, json.load(baseline),
+                                            tolerance)
+        if regressions:
+            raise CommandError('Регрессии:\n' + '\n'.join(regressions))
+        self.stdout.write('Регрессий нет')
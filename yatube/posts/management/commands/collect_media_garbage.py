@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import media, uploads
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Удаляет картинки и миниатюры, на которые не ссылается '
+            'ни один пост, и просроченные загрузки частями.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать, что будет удалено.')
+        parser.add_argument('--min-age', type=int, default=3600,
+                            help='Не трогать файлы моложе стольких секунд.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0.5,
+                            help='Пауза между пачками удаления, секунды.')
+        parser.add_argument('--set-limit', type=int, default=1000000,
+                            help='Больше ссылок — использовать фильтр Блума.')
+        parser.add_argument('--upload-ttl', type=int,
+                            default=settings.CHUNKED_UPLOAD_TTL,
+                            help='Удалять загрузки старше стольких секунд.')
+
+    def handle(self, *args, **options):
+        verbose = options['verbosity'] > 1 or options['dry_run']
+        report = media.collect_garbage(
+            Post._meta.get_field('image').storage,
+            min_age=options['min_age'],
+            batch_size=options['batch_size'],
+            sleep=options['sleep'],
+            dry_run=options['dry_run'],
+            set_limit=options['set_limit'],
+            log=self.stdout.write if verbose else None,
+        )
+        self.stdout.write(
+            f'Файлов: {report["files"]}, без ссылок: {report["orphans"]} '
+            f'({report["bytes"] / 1024 / 1024:.1f} МБ), '
+            f'удалено: {report["deleted"]}'
+        )
+        expired = uploads.expire(options['upload_ttl'],
+                                 dry_run=options['dry_run'])
+        self.stdout.write(f'Просроченных загрузок: {expired}')
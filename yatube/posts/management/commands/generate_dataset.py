@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.dataset import DatasetExists, Generator
+
+
+class Command(BaseCommand):
+    help = ('Создаёт воспроизводимый по seed набор пользователей, групп, '
+            'подписок, постов и комментариев для бенчмарков.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--follows', type=int, default=100000)
+        parser.add_argument('--posts', type=int, default=1000000)
+        parser.add_argument('--comments', type=int, default=1000000)
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--skip-feeds', action='store_true',
+                            help='Не раскладывать посты по лентам.')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь')
+        for name in ('groups', 'follows', 'posts', 'comments'):
+            if options[name] < 0:
+                raise CommandError(f'--{name} не может быть меньше нуля')
+        if options['comments'] and not options['posts']:
+            raise CommandError('Комментариям нужен хотя бы один пост')
+        started = time.monotonic()
+        generator = Generator(options['seed'], options['batch_size'],
+                              options['days'], log=self.stdout.write)
+        try:
+            generator.run(options['users'], options['groups'],
+                          options['posts'], options['comments'],
+                          options['follows'], feeds=not options['skip_feeds'])
+        except DatasetExists as error:
+            raise CommandError(error)
+        self.stdout.write(
+            f'Готово за {time.monotonic() - started:.0f} с')
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает закэшированные счётчики постов лент.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = counters.reconcile(batch_size=options['batch_size'])
+        self.stdout.write(f'Пересчитано счётчиков: {total}')
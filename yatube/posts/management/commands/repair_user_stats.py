@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts import stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает статистику пользователей из постов и подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        total = stats.recompute(batch_size=options['batch_size'])
+        self.stdout.write(f'Пересчитана статистика пользователей: {total}')
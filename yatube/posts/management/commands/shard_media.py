@@ -0,0 +1,93 @@
+import os
+import shutil
+import uuid
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, Count, Value, When
+from sorl.thumbnail import delete as delete_with_thumbnails
+from sorl.thumbnail.images import ImageFile
+
+from posts import versions
+from posts.models import MediaFile, Post
+from posts.storage import HASHED_NAME_RE, file_digest
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки постов в каталоги по хэшу содержимого. '
+            'Уже перенесённые файлы пропускаются, поэтому команду можно '
+            'прервать и запустить снова.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        self.storage = Post._meta.get_field('image').storage
+        rows = (Post.objects.exclude(image='').order_by('pk')
+                .values_list('pk', 'image'))
+        moved = failed = 0
+        last_pk = 0
+        while True:
+            batch = list(rows.filter(pk__gt=last_pk)[:options['batch_size']])
+            if not batch:
+                break
+            last_pk = batch[-1][0]
+            renames = {}
+            for _, name in batch:
+                if name in renames or HASHED_NAME_RE.match(name):
+                    continue
+                try:
+                    renames[name] = self.link(name)
+                except (OSError, SuspiciousFileOperation) as error:
+                    failed += 1
+                    self.stderr.write(f'{name}: {error}')
+            if renames:
+                self.update_rows(renames)
+                moved += len(renames)
+        self.stdout.write(f'Перенесено файлов: {moved}, ошибок: {failed}')
+
+    def link(self, name) -> str:
+        """Создаёт файл под новым именем; старый удаляется после коммита."""
+        with self.storage.open(name) as content:
+            new_name = self.storage.hashed_name(name, file_digest(content))
+        if not self.storage.exists(new_name):
+            path = self.storage.path(new_name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            partial = f'{path}.{uuid.uuid4().hex}.part'
+            try:
+                os.link(self.storage.path(name), partial)
+            except OSError:
+                shutil.copyfile(self.storage.path(name), partial)
+            os.replace(partial, path)
+        return new_name
+
+    @transaction.atomic
+    def update_rows(self, renames):
+        posts = Post.objects.filter(image__in=list(renames))
+        version_keys = []
+        for post_id, author_id, group_id in posts.values_list(
+                'pk', 'author_id', 'group_id'):
+            version_keys.extend(
+                versions.post_version_keys(post_id, author_id, [group_id]))
+        posts.update(image=Case(
+            *(When(image=old, then=Value(new))
+              for old, new in renames.items()),
+            default='image',
+        ))
+        new_names = set(renames.values())
+        references = (Post.objects.filter(image__in=new_names).order_by()
+                      .values_list('image').annotate(total=Count('id')))
+        MediaFile.objects.filter(
+            name__in=list(renames) + list(new_names)).delete()
+        MediaFile.objects.bulk_create(
+            MediaFile(name=name, refcount=total)
+            for name, total in references
+        )
+        old_files = [ImageFile(old, self.storage) for old in renames]
+        transaction.on_commit(lambda: self.cleanup(old_files, version_keys))
+
+    def cleanup(self, old_files, version_keys):
+        versions.bump(version_keys)
+        for old_file in old_files:
+            delete_with_thumbnails(old_file)
@@ -0,0 +1,53 @@
+import re
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.slow_queries import aggregate
+
+SQL_WIDTH: int = 200
+# Длинный список столбцов SELECT в отчёте только мешает.
+COLUMNS_RE = re.compile(r'^SELECT (?:DISTINCT )?.*? FROM ')
+
+
+class Command(BaseCommand):
+    help = ('Складывает лог медленных SQL-запросов по отпечатку и '
+            'показывает, какие запросы съедают больше всего времени БД.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--log', default=settings.SLOW_QUERY_LOG,
+                            help='Файл лога медленных запросов.')
+        parser.add_argument('--where',
+                            help='Только запросы из этого файла, например '
+                                 'posts/views.py.')
+        parser.add_argument('--limit', type=int, default=10)
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['log'], encoding='utf-8') as log:
+                groups = aggregate(log, where=options['where'])
+        except FileNotFoundError:
+            raise CommandError(
+                f'Нет лога медленных запросов: {options["log"]}')
+        if not groups:
+            self.stdout.write('Медленных запросов нет')
+            return
+        for place, group in enumerate(groups[:options['limit']], 1):
+            self.report(place, group)
+
+    def report(self, place, group):
+        self.stdout.write(
+            f'{place:>2}. {group["total_ms"]:.1f} мс '
+            f'({group["share"]:.0%} времени), {group["count"]} раз, '
+            f'макс {group["max_ms"]:.1f} мс  [{group["fingerprint"]}]'
+        )
+        sql = COLUMNS_RE.sub('SELECT … FROM ', group['sql'])
+        self.stdout.write(f'    {sql[:SQL_WIDTH]}')
+        for call_site, count in group['call_sites'].most_common(3):
+            self.stdout.write(f'    вызов: {call_site} ×{count}')
+        for template, count in group['templates'].most_common(3):
+            self.stdout.write(f'    шаблон: {template} ×{count}')
+        if group['params']:
+            self.stdout.write(f'    параметры: {", ".join(group["params"])}')
+        for line in group['plan'] or ():
+            self.stdout.write(f'    план: {line}')
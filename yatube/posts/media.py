@@ -0,0 +1,154 @@
+import hashlib
+import logging
+import math
+import os
+import time
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import transaction
+from django.db.models import F
+from sorl.thumbnail import default
+from sorl.thumbnail import delete as delete_with_thumbnails
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from .models import MediaFile, Post
+from .thumbnails import THUMBNAIL_SIZES, thumbnail_names
+
+
+logger = logging.getLogger(__name__)
+
+
+def acquire(name) -> None:
+    """Учитывает ещё одну ссылку поста на файл."""
+    if not name:
+        return
+    MediaFile.objects.bulk_create([MediaFile(name=name)],
+                                  ignore_conflicts=True)
+    MediaFile.objects.filter(name=name).update(refcount=F('refcount') + 1)
+
+
+def release(name) -> None:
+    """Снимает ссылку; файл без ссылок удаляется вместе с миниатюрами."""
+    if not name:
+        return
+    MediaFile.objects.filter(name=name, refcount__gt=0).update(
+        refcount=F('refcount') - 1)
+    deleted, _ = MediaFile.objects.filter(name=name, refcount=0).delete()
+    if deleted:
+        transaction.on_commit(lambda: _delete_file(name))
+
+
+def _delete_file(name):
+    # Ту же картинку могли загрузить снова, пока шла транзакция.
+    if MediaFile.objects.filter(name=name).exists():
+        return
+    storage = Post._meta.get_field('image').storage
+    try:
+        delete_with_thumbnails(ImageFile(name, storage))
+    except (OSError, SuspiciousFileOperation):
+        logger.exception('Could not delete media file %s', name)
+
+
+class BloomFilter:
+    """Множество строк в фиксированной памяти с ложными срабатываниями.
+
+    Ложное срабатывание только оставляет лишний файл на диске.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = math.ceil(
+            -capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(item))
+
+
+def referenced_names(storage, set_limit=1000000):
+    """Картинки постов и их миниатюры: set или BloomFilter для больших баз."""
+    images = (Post.objects.exclude(image='').order_by()
+              .values_list('image', flat=True).distinct())
+    total = images.count() * (1 + len(THUMBNAIL_SIZES))
+    names = set() if total <= set_limit else BloomFilter(total)
+    for name in images.iterator(chunk_size=10000):
+        names.add(name)
+        for thumbnail in thumbnail_names(name, storage):
+            names.add(thumbnail)
+    return names
+
+
+def iter_files(root, directories):
+    """Обходит каталоги потоком: (имя относительно root, stat)."""
+    stack = [os.path.join(root, directory) for directory in directories]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    name = os.path.relpath(entry.path, root)
+                    yield name.replace(os.sep, '/'), entry.stat()
+
+
+def collect_garbage(storage, *, min_age=3600, batch_size=1000, sleep=0.0,
+                    dry_run=False, set_limit=1000000, log=None):
+    """Удаляет файлы картинок и миниатюр, на которые не ссылается ни один пост.
+
+    Файлы моложе min_age секунд не трогаются: пост с ними может быть
+    ещё не сохранён. Между пачками удаления делается пауза sleep.
+    """
+    upload_to = Post._meta.get_field('image').upload_to
+    referenced = referenced_names(storage, set_limit)
+    deadline = time.time() - min_age
+    report = {'files': 0, 'orphans': 0, 'bytes': 0, 'deleted': 0}
+    batch = []
+    for name, stat in iter_files(storage.location,
+                                 (upload_to, sorl_settings.THUMBNAIL_PREFIX)):
+        report['files'] += 1
+        if name in referenced or stat.st_mtime > deadline:
+            continue
+        report['orphans'] += 1
+        report['bytes'] += stat.st_size
+        if log:
+            log(name)
+        if dry_run:
+            continue
+        batch.append(name)
+        if len(batch) >= batch_size:
+            report['deleted'] += _delete_batch(storage, batch)
+            batch = []
+            time.sleep(sleep)
+    if batch:
+        report['deleted'] += _delete_batch(storage, batch)
+    return report
+
+
+def _delete_batch(storage, names) -> int:
+    deleted = 0
+    for name in names:
+        try:
+            os.remove(storage.path(name))
+            deleted += 1
+        except FileNotFoundError:
+            pass
+        # Иначе sorl считает миниатюру готовой и отдаёт ссылку на пустоту.
+        default.kvstore.delete(ImageFile(name, storage))
+    return deleted
@@ -0,0 +1,22 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_auto_20261018_1923'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='pulled',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(pulled=True), fields=['author', '-pub_date'], name='post_pulled_author_idx'),
+        ),
+    ]
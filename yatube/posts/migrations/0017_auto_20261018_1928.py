@@ -0,0 +1,76 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:28
+
+from collections import Counter
+import re
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fts5_supported(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                'CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(t)')
+            cursor.execute('DROP TABLE temp.fts5_probe')
+        except Exception:
+            return False
+    return True
+
+
+def build_search_index(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    SearchToken = apps.get_model('posts', 'SearchToken')
+    connection = schema_editor.connection
+    posts = Post.objects.values_list('id', 'text').iterator()
+    if fts5_supported(connection):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE VIRTUAL TABLE posts_post_fts '
+                "USING fts5(text, tokenize='unicode61')"
+            )
+            cursor.executemany(
+                'INSERT INTO posts_post_fts (rowid, text) VALUES (%s, %s)',
+                list(posts),
+            )
+        return
+    for post_id, text in posts:
+        terms = Counter(w[:64] for w in re.findall(r'\w+', text.lower()))
+        SearchToken.objects.bulk_create(
+            SearchToken(term=term, post_id=post_id, weight=weight)
+            for term, weight in terms.items()
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS posts_post_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_auto_20261018_1927'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('weight', models.PositiveIntegerField(default=1)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='posts.Post')),
+            ],
+            options={
+                'default_related_name': 'search_tokens',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='searchtoken',
+            index=models.Index(fields=['term', 'post'], name='search_term_post_idx'),
+        ),
+        migrations.RunPython(build_search_index, drop_search_index),
+    ]
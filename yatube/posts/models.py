@@ -1,7 +1,13 @@
+import os
+import uuid
+
+from django.conf import settings
 from django.db import models
 from django.contrib.auth import get_user_model
 from core.models import CreatedModel
 
+from .storage import ContentAddressedStorage
+
 
 User = get_user_model()
 
@@ -31,8 +37,18 @@ class Post(CreatedModel):
     )
     image = models.ImageField(
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True,
     )
+    # Размеры, средний цвет и крошечное превью картинки (data URI),
+    # чтобы шаблоны не открывали файл.
+    image_width = models.PositiveIntegerField(null=True, editable=False)
+    image_height = models.PositiveIntegerField(null=True, editable=False)
+    image_color = models.CharField(max_length=7, blank=True, editable=False)
+    image_lqip = models.TextField(blank=True, editable=False)
+    # Пост не разложен по лентам подписчиков и читается при показе ленты.
+    pulled = models.BooleanField(default=False, editable=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self) -> str:
         return f'{self.text[:TEXT_LEN]}'
@@ -40,6 +56,13 @@ class Post(CreatedModel):
     class Meta:
         ordering = ['-pub_date']
         default_related_name = 'posts'
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='post_pub_date_id_idx'),
+            models.Index(fields=['author', '-pub_date'],
+                         condition=models.Q(pulled=True),
+                         name='post_pulled_author_idx'),
+        ]
 
 
 class Comment(models.Model):
@@ -59,6 +82,10 @@ class Comment(models.Model):
     class Meta:
         ordering = ['-created']
         default_related_name = 'comments'
+        indexes = [
+            models.Index(fields=['post', '-created', '-id'],
+                         name='comment_post_created_idx'),
+        ]
 
 
 class Follow(models.Model):
@@ -73,3 +100,86 @@ class Follow(models.Model):
         verbose_name_plural = 'Лента авторов'
         constraints = [models.UniqueConstraint(
             fields=['user', 'author'], name='unique_members')]
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE)
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-pub_date', '-post_id']
+        default_related_name = 'feed_entries'
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = [models.UniqueConstraint(
+            fields=['user', 'post'], name='unique_feed_entry')]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='feed_user_pub_date_idx'),
+        ]
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(User, primary_key=True,
+                                related_name='stats',
+                                on_delete=models.CASCADE)
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Статистика автора'
+        verbose_name_plural = 'Статистика авторов'
+
+    def __str__(self) -> str:
+        return f'stats of {self.user}'
+
+
+class SearchToken(models.Model):
+    term = models.CharField(max_length=64)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE)
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        default_related_name = 'search_tokens'
+        indexes = [
+            models.Index(fields=['term', 'post'],
+                         name='search_term_post_idx'),
+        ]
+
+
+class MediaFile(models.Model):
+    """Число постов, которые ссылаются на файл картинки."""
+    name = models.CharField(max_length=255, unique=True)
+    refcount = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
+
+    def __str__(self) -> str:
+        return self.name
+
+
+class Upload(models.Model):
+    """Картинка, которая загружается частями до отправки формы поста."""
+    token = models.UUIDField(primary_key=True, default=uuid.uuid4,
+                             editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    checksum = models.CharField(max_length=64)
+    offset = models.BigIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        default_related_name = 'uploads'
+
+    def __str__(self) -> str:
+        return self.filename
+
+    @property
+    def path(self) -> str:
+        return os.path.join(settings.CHUNKED_UPLOAD_DIR, f'{self.token}.part')
@@ -0,0 +1,167 @@
+import re
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+
+from .models import Post, SearchToken
+
+
+FTS_TABLE = 'posts_post_fts'
+MAX_TERMS: int = 8
+TERM_LEN: int = 64
+WORD_RE = re.compile(r'\w+')
+
+
+def tokenize(text) -> list:
+    return [word[:TERM_LEN] for word in WORD_RE.findall(text.lower())]
+
+
+class FTS5Backend:
+    """Поиск через виртуальную таблицу SQLite FTS5 с ранжированием bm25."""
+
+    def index(self, post):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                           [post.pk])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)',
+                [post.pk, post.text],
+            )
+
+    def add_many(self, rows):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)',
+                rows,
+            )
+
+    def remove(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                           [post_id])
+
+    @staticmethod
+    def _match(terms):
+        return ' '.join(f'"{term}"' for term in terms)
+
+    def count(self, terms) -> int:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT count(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+                [self._match(terms)],
+            )
+            return cursor.fetchone()[0]
+
+    def ids(self, terms, start, stop) -> list:
+        # LIMIT -1 в SQLite — без ограничения.
+        limit = -1 if stop is None else stop - start
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+                'ORDER BY rank LIMIT %s OFFSET %s',
+                [self._match(terms), limit, start],
+            )
+            return [row[0] for row in cursor.fetchall()]
+
+
+class TokenIndexBackend:
+    """Собственный инвертированный индекс на модели SearchToken."""
+
+    def index(self, post):
+        SearchToken.objects.filter(post_id=post.pk).delete()
+        SearchToken.objects.bulk_create(
+            SearchToken(term=term, post_id=post.pk, weight=weight)
+            for term, weight in Counter(tokenize(post.text)).items()
+        )
+
+    def add_many(self, rows):
+        SearchToken.objects.bulk_create(
+            SearchToken(term=term, post_id=post_id, weight=weight)
+            for post_id, text in rows
+            for term, weight in Counter(tokenize(text)).items()
+        )
+
+    def remove(self, post_id):
+        SearchToken.objects.filter(post_id=post_id).delete()
+
+    def _matches(self, terms):
+        return (SearchToken.objects.filter(term__in=terms).order_by()
+                .values('post_id')
+                .annotate(hits=Count('term', distinct=True),
+                          score=Sum('weight'))
+                .filter(hits=len(set(terms))))
+
+    def count(self, terms) -> int:
+        return self._matches(terms).count()
+
+    def ids(self, terms, start, stop) -> list:
+        return list(self._matches(terms).order_by('-score', '-post_id')
+                    .values_list('post_id', flat=True)[start:stop])
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with connection.cursor() as cursor:
+            tables = connection.introspection.table_names(cursor)
+        if FTS_TABLE in tables:
+            _backend = FTS5Backend()
+        else:
+            _backend = TokenIndexBackend()
+    return _backend
+
+
+def index_post(post) -> None:
+    get_backend().index(post)
+
+
+def remove_post(post_id) -> None:
+    get_backend().remove(post_id)
+
+
+def index_new_posts(queryset, batch_size=10000) -> None:
+    """Индексирует новые посты пачками: bulk_create не вызывает сигналы."""
+    backend = get_backend()
+    rows = queryset.order_by('pk').values_list('pk', 'text')
+    last_pk = 0
+    while True:
+        batch = list(rows.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return
+        with transaction.atomic():
+            backend.add_many(batch)
+        last_pk = batch[-1][0]
+
+
+class SearchResults:
+    """Ранжированная выдача, которую можно передать в Paginator."""
+
+    def __init__(self, query, queryset=None):
+        self.terms = tokenize(query)[:MAX_TERMS]
+        if queryset is None:
+            queryset = Post.objects.select_related('author', 'group')
+        self.queryset = queryset
+
+    def count(self) -> int:
+        if not self.terms:
+            return 0
+        return get_backend().count(self.terms)
+
+    def __len__(self):
+        return self.count()
+
+    def ids(self, start=0, stop=None) -> list:
+        if not self.terms:
+            return []
+        return get_backend().ids(self.terms, start, stop)
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        ids = self.ids(index.start or 0, index.stop)
+        posts = self.queryset.in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
@@ -0,0 +1,146 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import counters, feed, media, search, stats, versions
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+@receiver(pre_save, sender=Post)
+def remember_old_group(sender, instance, **kwargs):
+    instance._old_group_id = None
+    instance._old_image = ''
+    if instance.pk is None:
+        instance.pulled = feed.should_pull(instance.author_id)
+    else:
+        instance._old_group_id, instance._old_image = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list('group_id', 'image').first() or (None, '')
+        )
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, **kwargs):
+    search.index_post(instance)
+    version_keys = versions.post_version_keys(
+        instance.pk, instance.author_id,
+        (instance.group_id, getattr(instance, '_old_group_id', None)))
+    transaction.on_commit(lambda: versions.bump(version_keys))
+    old_image = getattr(instance, '_old_image', '')
+    if instance.image.name != old_image:
+        media.acquire(instance.image.name)
+        media.release(old_image)
+    if created:
+        stats.change_stats(instance.author_id, posts_count=1)
+        feed.fan_out(instance)
+        keys = counters.post_count_keys(instance.group_id, instance.author_id)
+        transaction.on_commit(lambda: counters.change_counts(keys, 1))
+        return
+    old_group_id = getattr(instance, '_old_group_id', None)
+    if old_group_id != instance.group_id:
+        keys = [counters.count_key(group_id=group_id)
+                for group_id in (old_group_id, instance.group_id)
+                if group_id is not None]
+        transaction.on_commit(lambda: counters.invalidate(keys))
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    search.remove_post(instance.pk)
+    version_keys = versions.post_version_keys(
+        instance.pk, instance.author_id, (instance.group_id,))
+    transaction.on_commit(lambda: versions.bump(version_keys))
+    stats.change_stats(instance.author_id, posts_count=-1)
+    media.release(instance.image.name)
+    keys = counters.post_count_keys(instance.group_id, instance.author_id)
+    transaction.on_commit(lambda: counters.change_counts(keys, -1))
+
+
+def bump_follow_versions(follow):
+    keys = [versions.version_key('author', follow.author_id),
+            versions.version_key('author', follow.user_id)]
+    transaction.on_commit(lambda: versions.bump(keys))
+
+
+@receiver(post_save, sender=Follow)
+def backfill_feed(sender, instance, created, **kwargs):
+    bump_follow_versions(instance)
+    if created:
+        stats.change_stats(instance.author_id, followers_count=1)
+        stats.change_stats(instance.user_id, following_count=1)
+        feed.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_feed(sender, instance, **kwargs):
+    bump_follow_versions(instance)
+    stats.change_stats(instance.author_id, followers_count=-1)
+    stats.change_stats(instance.user_id, following_count=-1)
+    feed.trim(instance.user_id, instance.author_id)
+
+
+@receiver(pre_save, sender=User)
+def remember_old_name(sender, instance, update_fields=None, **kwargs):
+    instance._old_name = None
+    # Вход обновляет только last_login: лишний SELECT не нужен.
+    if update_fields is not None and not set(update_fields).intersection(
+            versions.AUTHOR_NAME_FIELDS):
+        return
+    if instance.pk is not None:
+        instance._old_name = User.objects.filter(pk=instance.pk).values_list(
+            *versions.AUTHOR_NAME_FIELDS).first()
+
+
+@receiver(post_save, sender=User)
+def bump_author_versions(sender, instance, created, **kwargs):
+    old_name = getattr(instance, '_old_name', None)
+    name = tuple(getattr(instance, field)
+                 for field in versions.AUTHOR_NAME_FIELDS)
+    if created or old_name is None or old_name == name:
+        return
+    keys = versions.author_version_keys(instance.pk)
+    transaction.on_commit(lambda: versions.bump(keys))
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, raw=False, **kwargs):
+    # В фикстуре loaddata счётчик уже учтён.
+    if created and not raw and instance.post_id is not None:
+        Post.objects.filter(pk=instance.post_id).update(
+            comment_count=F('comment_count') + 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    if instance.post_id is not None:
+        Post.objects.filter(pk=instance.post_id).update(
+            comment_count=Greatest(F('comment_count') - 1, 0))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def bump_comment_versions(sender, instance, **kwargs):
+    try:
+        post = instance.post
+    except Post.DoesNotExist:
+        return
+    if post is not None:
+        keys = versions.post_version_keys(post.pk, post.author_id,
+                                          (post.group_id,))
+        transaction.on_commit(lambda: versions.bump(keys))
+
+
+@receiver(post_save, sender=Group)
+def bump_group_version(sender, instance, **kwargs):
+    # Название группы есть и в общей ленте.
+    keys = [versions.version_key('group', instance.pk),
+            versions.version_key('all')]
+    transaction.on_commit(lambda: versions.bump(keys))
@@ -0,0 +1,64 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from core.query_budget import unbudgeted
+from .models import Follow, Post, User, UserStats
+
+
+def change_stats(user_id, **deltas) -> None:
+    """Сдвигает счётчики статистики одним UPDATE в текущей транзакции.
+
+    Разошедшийся с базой счётчик не уходит ниже нуля, а строка, которой
+    нет (данные загружены мимо сигналов), создаётся пересчётом.
+    """
+    updated = UserStats.objects.filter(user_id=user_id).update(**{
+        field: Greatest(F(field) + delta, 0)
+        for field, delta in deltas.items()
+    })
+    if not updated:
+        _recompute([user_id])
+
+
+def _count_subquery(queryset, field):
+    counts = (queryset.filter(**{field: OuterRef('user_id')}).order_by()
+              .values(field).annotate(total=Count('id')).values('total'))
+    return Coalesce(Subquery(counts), 0)
+
+
+def _recompute(pks) -> None:
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=pk) for pk in pks),
+        ignore_conflicts=True,
+    )
+    UserStats.objects.filter(user_id__in=pks).update(
+        posts_count=_count_subquery(Post.objects, 'author'),
+        followers_count=_count_subquery(Follow.objects, 'author'),
+        following_count=_count_subquery(Follow.objects, 'user'),
+    )
+
+
+def get_stats(user) -> UserStats:
+    """user.stats; недостающую строку создаёт пересчётом."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        pass
+    # Разовая починка не должна ронять страницу по бюджету запросов.
+    with unbudgeted():
+        _recompute([user.pk])
+        user.stats = UserStats.objects.get(user_id=user.pk)
+    return user.stats
+
+
+def recompute(batch_size=10000) -> int:
+    """Пересчитывает статистику всех пользователей пачками по user_id."""
+    users = User.objects.order_by('pk').values_list('pk', flat=True)
+    total = 0
+    last_pk = 0
+    while True:
+        pks = list(users.filter(pk__gt=last_pk)[:batch_size])
+        if not pks:
+            return total
+        _recompute(pks)
+        total += len(pks)
+        last_pk = pks[-1]
@@ -0,0 +1,46 @@
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+# posts/ab/cd/abcd...ef.jpg — два уровня каталогов по первым байтам хэша.
+HASHED_NAME_RE = re.compile(
+    r'^(?:.*/)?(?P<a>[0-9a-f]{2})/(?P<b>[0-9a-f]{2})/'
+    r'(?P=a)(?P=b)[0-9a-f]{60}(?:\.\w+)?$')
+
+
+def file_digest(content) -> str:
+    """sha256 содержимого файла, читаемого по частям."""
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранит файл под хэшем содержимого: одинаковые загрузки — один файл.
+
+    Сколько постов ссылается на файл, считает модель MediaFile.
+    """
+
+    def hashed_name(self, name, digest) -> str:
+        """Имя в каталоге по первым байтам хэша, чтобы каталоги не росли."""
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(os.path.dirname(name), digest[:2], digest[2:4],
+                            digest + extension)
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, file_digest(content))
+        if self.exists(name):
+            return name.replace('\\', '/')
+        # Файл появляется под итоговым именем только целиком.
+        partial = super()._save(f'{name}.{uuid.uuid4().hex}.part', content)
+        os.replace(self.path(partial), self.path(name))
+        return name.replace('\\', '/')
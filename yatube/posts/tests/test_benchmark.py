@@ -0,0 +1,42 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from ..benchmark import VIEWS
+from ..models import Comment, Post
+
+
+class BenchmarkViewsTests(TestCase):
+    def test_benchmark_reports_and_compares_with_baseline(self):
+        """Every view is measured, writes are rolled back, growth fails."""
+        call_command('generate_dataset', '--seed=5', '--users=20',
+                     '--groups=2', '--follows=40', '--posts=60',
+                     '--comments=30', stdout=StringIO())
+        posts, comments = Post.objects.count(), Comment.objects.count()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        output = os.path.join(directory, 'benchmark.json')
+        call_command('benchmark_views', '--iterations=3', '--warmup=1',
+                     f'--output={output}', stdout=StringIO(),
+                     stderr=StringIO())
+        with open(output) as results_file:
+            results = json.load(results_file)
+        self.assertEqual(set(results['views']), set(VIEWS))
+        self.assertEqual(results['views']['index']['status'], [200])
+        self.assertEqual(results['views']['add_comment']['status'], [302])
+        self.assertGreater(results['views']['follow_index']['queries'], 0)
+        self.assertGreater(results['views']['profile']['rows'], 0)
+        self.assertEqual(Post.objects.count(), posts)
+        self.assertEqual(Comment.objects.count(), comments)
+        results['views']['index']['queries'] = 0
+        with open(output, 'w') as baseline_file:
+            json.dump(results, baseline_file)
+        with self.assertRaisesMessage(CommandError, 'index'):
+            call_command('benchmark_views', '--iterations=1',
+                         '--views', 'index', f'--baseline={output}',
+                         stdout=StringIO(), stderr=StringIO())
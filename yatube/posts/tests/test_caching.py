@@ -0,0 +1,104 @@
+from http import HTTPStatus
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.test import Client, TransactionTestCase
+from django.urls import reverse
+
+from .. import versions
+from ..models import Comment, Group, Post
+
+User = get_user_model()
+
+
+class ConditionalGetTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.user = User.objects.create_user(username='auth')
+        self.post = Post.objects.create(text='Тестовый текст',
+                                        author=self.user)
+
+    def test_not_modified_until_change(self):
+        """Feed and detail pages answer 304 until their data changes."""
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:profile', kwargs={'username': 'auth'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+        )
+        etags = {}
+        for url in urls:
+            response = self.guest_client.get(url)
+            etags[url] = response['ETag']
+            response = self.guest_client.get(
+                url, HTTP_IF_NONE_MATCH=etags[url])
+            self.assertEqual(response.status_code,
+                             HTTPStatus.NOT_MODIFIED, url)
+        Comment.objects.create(post=self.post, author=self.user,
+                               text='Комментарий')
+        for url in urls:
+            response = self.guest_client.get(
+                url, HTTP_IF_NONE_MATCH=etags[url])
+            self.assertEqual(response.status_code, HTTPStatus.OK, url)
+
+    def _etags(self, urls):
+        return {url: self.guest_client.get(url)['ETag'] for url in urls}
+
+    def _assert_modified(self, etags):
+        for url, etag in etags.items():
+            response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, HTTPStatus.OK, url)
+
+    def test_renamed_group_changes_index(self):
+        """Renaming a group invalidates the index and the group page."""
+        group = Group.objects.create(title='Коты', slug='cats')
+        self.post.group = group
+        self.post.save()
+        etags = self._etags((
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': 'cats'}),
+        ))
+        group.title = 'Кошки'
+        group.save()
+        self._assert_modified(etags)
+
+    def test_renamed_author_changes_pages(self):
+        """A new author name invalidates every page that shows it."""
+        etags = self._etags((
+            reverse('posts:index'),
+            reverse('posts:profile', kwargs={'username': 'auth'}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}),
+        ))
+        self.user.first_name = 'Лев'
+        self.user.save()
+        self._assert_modified(etags)
+
+    def test_login_keeps_etags(self):
+        """Saving a user without a new name keeps the index ETag."""
+        url = reverse('posts:index')
+        etag = self.guest_client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            self.user.save(update_fields=['last_login'])
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_new_csrf_token_changes_etag(self):
+        """After a new login the page with a form is sent again."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        client = Client()
+        client.force_login(self.user)
+        client.get(url)
+        etag = client.get(url)['ETag']
+        client.logout()
+        client.force_login(self.user)
+        client.get(reverse('posts:index'))
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_versions_skip_local_tier(self):
+        """A version bumped by another worker is seen at once."""
+        url = reverse('posts:index')
+        etag = self.guest_client.get(url)['ETag']
+        caches['shared'].set(versions.version_key('all'), 0, None)
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
@@ -0,0 +1,75 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TransactionTestCase
+from django.urls import reverse
+
+from ..counters import count_key, total_count
+from ..models import Group, Post
+from ..utils import NUMBER_OF_POSTS
+
+User = get_user_model()
+
+
+class CachedCountTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.user = User.objects.create_user(username='auth')
+        self.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_group',
+            description='Тестовое описание',
+        )
+        self.key = count_key(group_id=self.group.pk)
+        self.url = reverse('posts:group_list',
+                           kwargs={'slug': self.group.slug})
+
+    def create_post(self):
+        return Post.objects.create(text='Тестовый текст',
+                                   group=self.group,
+                                   author=self.user)
+
+    def test_signals_keep_count(self):
+        '''Post create and delete keep the cached group count.'''
+        self.create_post()
+        response = self.guest_client.get(self.url)
+        self.assertEqual(response.context['page_obj'].paginator.count, 1)
+        self.assertEqual(cache.get(self.key), 1)
+        post = self.create_post()
+        self.assertEqual(cache.get(self.key), 2)
+        post.delete()
+        self.assertEqual(cache.get(self.key), 1)
+
+    def test_low_count_is_recounted(self):
+        '''A full last page with posts after it drops a too low count.'''
+        for _ in range(NUMBER_OF_POSTS + 1):
+            self.create_post()
+        cache.set(self.key, NUMBER_OF_POSTS)
+        response = self.guest_client.get(self.url)
+        self.assertFalse(response.context['page_obj'].has_next())
+        self.assertIsNone(cache.get(self.key))
+        response = self.guest_client.get(self.url)
+        self.assertEqual(response.context['page_obj'].paginator.count,
+                         NUMBER_OF_POSTS + 1)
+        self.assertTrue(response.context['page_obj'].has_next())
+
+    def test_total_count_is_read_from_cache(self):
+        '''total_count (posts table gauge) follows signals without COUNT.'''
+        self.create_post()
+        self.assertEqual(total_count(), 1)
+        self.create_post()
+        with self.assertNumQueries(0):
+            self.assertEqual(total_count(), 2)
+
+    def test_reconcile_fixes_drift(self):
+        '''reconcile_post_counts rewrites counts from the database.'''
+        self.create_post()
+        cache.set(self.key, 100)
+        cache.set(count_key(author_id=self.user.pk), 100)
+        call_command('reconcile_post_counts', stdout=StringIO())
+        self.assertEqual(cache.get(self.key), 1)
+        self.assertEqual(cache.get(count_key(author_id=self.user.pk)), 1)
+        self.assertEqual(cache.get(count_key()), 1)
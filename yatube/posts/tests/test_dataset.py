@@ -0,0 +1,49 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from ..models import Comment, Follow, Group, Post, UserStats
+
+User = get_user_model()
+
+
+class GenerateDatasetTests(TestCase):
+    def generate(self, seed):
+        call_command('generate_dataset', f'--seed={seed}', '--users=30',
+                     '--groups=3', '--follows=60', '--posts=200',
+                     '--comments=300', stdout=StringIO())
+        return list(Post.objects.filter(author__username__startswith=(
+            f'gen{seed}_')).order_by('pk').values_list('text', flat=True))
+
+    def test_dataset_is_consistent_and_reproducible(self):
+        """Generated rows and derived data agree; the seed fixes the data."""
+        posts = self.generate(1)
+        self.assertEqual(len(posts), 200)
+        self.assertEqual(Comment.objects.count(), 300)
+        self.assertEqual(
+            sum(Post.objects.values_list('comment_count', flat=True)), 300)
+        self.assertEqual(
+            sum(UserStats.objects.values_list('followers_count', flat=True)),
+            Follow.objects.count())
+        with self.assertRaises(CommandError):
+            self.generate(1)
+        User.objects.filter(username__startswith='gen1_').delete()
+        Group.objects.filter(slug__startswith='gen1-').delete()
+        self.assertEqual(self.generate(1), posts)
+
+    def test_empty_parts_of_dataset(self):
+        """Zero posts or groups are fine; impossible sizes are rejected."""
+        call_command('generate_dataset', '--seed=2', '--users=1',
+                     '--groups=0', '--follows=0', '--posts=0',
+                     '--comments=0', stdout=StringIO())
+        self.assertEqual(User.objects.filter(
+            username__startswith='gen2_').count(), 1)
+        self.assertFalse(Post.objects.exists())
+        for options in (('--users=0',), ('--posts=0', '--comments=5'),
+                        ('--groups=-1',)):
+            with self.subTest(options=options):
+                with self.assertRaises(CommandError):
+                    call_command('generate_dataset', '--seed=3', *options,
+                                 stdout=StringIO())
@@ -0,0 +1,121 @@
+from http import HTTPStatus
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import (Client, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..feed import HybridFeed
+from ..models import FeedEntry, Follow, Post
+
+User = get_user_model()
+
+
+class FanOutTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth_1')
+        self.author = User.objects.create_user(username='a_author')
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_unfollow_removes_posts_from_feed(self):
+        '''Unsubscribing trims the author's posts from the feed.'''
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(author=self.author, text='Тестовый текст')
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.user, post=post).exists())
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow',
+                    kwargs={'username': self.author.username}),
+        )
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertNotIn(post, response.context['page_obj'])
+        self.assertFalse(FeedEntry.objects.filter(user=self.user).exists())
+
+
+@override_settings(FEED_FANOUT_THRESHOLD=1)
+class HybridFeedTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth_1')
+        self.user_2 = User.objects.create_user(username='auth_2')
+        self.author = User.objects.create_user(username='a_author')
+        self.popular = User.objects.create_user(username='popular')
+        Follow.objects.create(user=self.user, author=self.author)
+        Follow.objects.create(user=self.user, author=self.popular)
+        Follow.objects.create(user=self.user_2, author=self.popular)
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_popular_author_is_pulled(self):
+        '''Posts of popular authors are merged into the feed on read.'''
+        posts = [
+            Post.objects.create(author=author, text=f'Текст {i}')
+            for i, author in enumerate(
+                (self.author, self.popular, self.author, self.popular))
+        ]
+        self.assertFalse(FeedEntry.objects.filter(
+            post__author=self.popular).exists())
+        self.assertTrue(Post.objects.get(pk=posts[1].pk).pulled)
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(list(response.context['page_obj']),
+                         posts[::-1])
+
+    def test_seek_reads_one_page_per_source(self):
+        '''Every feed source reads one page from the cursor, at any depth.'''
+        posts = [
+            Post.objects.create(author=author, text=f'Текст {i}')
+            for i, author in enumerate((self.author, self.popular) * 6)
+        ]
+        feed = HybridFeed(self.user)
+        key = (posts[7].pub_date, posts[7].pk)
+        with CaptureQueriesContext(connection) as queries:
+            older = feed.seek(key, 3)
+            newer = feed.seek(key, 3, newer=True)
+        self.assertEqual(older, posts[6:3:-1])
+        self.assertEqual(newer, posts[8:11])
+        self.assertTrue(all('LIMIT 3' in query['sql']
+                            for query in queries.captured_queries))
+
+    def test_feed_with_many_popular_authors(self):
+        '''Thousands of pulled authors are fetched in batches.'''
+        User.objects.bulk_create(
+            User(username=f'pulled_{i}') for i in range(1100))
+        authors = User.objects.filter(username__startswith='pulled_')
+        Follow.objects.bulk_create(
+            Follow(user=self.user, author=author) for author in authors)
+        Post.objects.bulk_create(
+            Post(author=author, text='Текст', pulled=True)
+            for author in authors)
+        response = self.authorized_client.get(reverse('posts:follow_index'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        page = list(response.context['page_obj'])
+        self.assertEqual(len(page), 10)
+        self.assertEqual(page[0],
+                         Post.objects.filter(pulled=True).latest('pk'))
+        self.assertTrue(response.context['page_obj'].has_next())
+
+    def test_feed_pages_by_cursor_without_count(self):
+        '''The feed walks both ways by cursor and never runs COUNT.'''
+        posts = [
+            Post.objects.create(author=author, text=f'Текст {i}')
+            for i, author in enumerate((self.author, self.popular) * 6)
+        ]
+        url = reverse('posts:follow_index')
+        with CaptureQueriesContext(connection) as queries:
+            first = self.authorized_client.get(url).context['page_obj']
+            second = self.authorized_client.get(
+                f'{url}?after={first.next_cursor()}').context['page_obj']
+            back = self.authorized_client.get(
+                f'{url}?before={second.previous_cursor()}'
+            ).context['page_obj']
+        self.assertEqual(list(first), posts[:1:-1])
+        self.assertEqual(list(second), posts[1::-1])
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(second.has_next())
+        self.assertFalse(back.has_previous())
+        self.assertFalse(any('COUNT(' in query['sql']
+                             for query in queries.captured_queries))
@@ -4,6 +4,7 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from posts.models import Group, Post, Comment, Follow
+import hashlib
 import shutil
 import tempfile
 from http import HTTPStatus
@@ -34,6 +35,11 @@ class PostFormTests(TestCase):
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
 
+    @staticmethod
+    def hashed_name(content, extension):
+        digest = hashlib.sha256(content).hexdigest()
+        return f'posts/{digest[:2]}/{digest[2:4]}/{digest}.{extension}'
+
     def test_create_post(self):
         '''Checkout create of post.'''
         small_gif = (
@@ -84,7 +90,7 @@ class PostFormTests(TestCase):
         error_name_5 = 'Error! Image of post does not match.'
         self.assertEqual(
             post.image,
-            f'posts/{uploaded}',
+            self.hashed_name(small_gif, 'gif'),
             error_name_5,
         )
 
@@ -157,7 +163,7 @@ class PostFormTests(TestCase):
         error_name_5 = 'Error! Image of post does not match.'
         self.assertEqual(
             post.image,
-            f'posts/{uploaded}',
+            self.hashed_name(small_gif, 'gif'),
             error_name_5,
         )
 
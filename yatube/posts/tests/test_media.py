@@ -0,0 +1,294 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.images import ImageFile
+
+from .. import thumbnails
+from ..images import MAX_IMAGE_SIDE
+from ..models import MediaFile, Post
+from ..thumbnails import prefetch
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaStorageTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    @staticmethod
+    def hashed_name(content, extension):
+        digest = hashlib.sha256(content).hexdigest()
+        return f'posts/{digest[:2]}/{digest[2:4]}/{digest}.{extension}'
+
+    def test_uploaded_image_is_normalized(self):
+        '''Uploads are scaled down and saved without EXIF.'''
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        buffer = BytesIO()
+        Image.new('RGB', (3000, 100)).save(buffer, 'JPEG', exif=exif)
+        uploaded = SimpleUploadedFile(name='photo.jpeg',
+                                      content=buffer.getvalue(),
+                                      content_type='image/jpeg')
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Фото', 'image': uploaded},
+        )
+        post = Post.objects.get(text='Фото')
+        self.assertRegex(post.image.name,
+                         r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        with Image.open(post.image) as image:
+            self.assertEqual(image.width, MAX_IMAGE_SIDE)
+            self.assertNotIn('exif', image.info)
+
+    def test_duplicate_uploads_share_file(self):
+        '''Identical uploads are stored once and reference counted.'''
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        for name in ('meme.gif', 'meme_copy.gif'):
+            self.authorized_client.post(
+                reverse('posts:post_create'),
+                data={'text': name, 'image': SimpleUploadedFile(
+                    name, small_gif, content_type='image/gif')},
+            )
+        first, second = Post.objects.order_by('pk')
+        self.assertEqual(first.image.name, second.image.name)
+        media = MediaFile.objects.get(name=first.image.name)
+        self.assertEqual(media.refcount, 2)
+        first.delete()
+        media.refresh_from_db()
+        self.assertEqual(media.refcount, 1)
+        second.delete()
+        self.assertFalse(MediaFile.objects.filter(name=media.name).exists())
+
+    def test_shard_media_moves_flat_files(self):
+        '''shard_media moves old flat files into hash directories.'''
+        os.makedirs(os.path.join(TEMP_MEDIA_ROOT, 'posts'), exist_ok=True)
+        with open(os.path.join(TEMP_MEDIA_ROOT, 'posts', 'old.gif'),
+                  'wb') as file_:
+            file_.write(b'GIF89a')
+        post = Post.objects.create(text='Старый', author=self.user,
+                                   image='posts/old.gif')
+        call_command('shard_media', stdout=StringIO())
+        call_command('shard_media', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.image.name, self.hashed_name(b'GIF89a', 'gif'))
+        self.assertTrue(os.path.exists(post.image.path))
+        self.assertEqual(MediaFile.objects.get(name=post.image.name).refcount,
+                         1)
+        self.assertFalse(MediaFile.objects.filter(
+            name='posts/old.gif').exists())
+
+    @override_settings(
+        CHUNKED_UPLOAD_DIR=os.path.join(TEMP_MEDIA_ROOT, 'parts'))
+    def test_collect_media_garbage(self):
+        '''Orphaned files are reported on dry run and then deleted.'''
+        buffer = BytesIO()
+        Image.new('RGB', (20, 10)).save(buffer, 'PNG')
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Живой', 'image': SimpleUploadedFile(
+                'live.png', buffer.getvalue(), content_type='image/png')},
+        )
+        live = Post.objects.get(text='Живой').image.path
+        orphans = [os.path.join(TEMP_MEDIA_ROOT, 'posts', 'gone.gif'),
+                   os.path.join(TEMP_MEDIA_ROOT, 'cache', 'ab', 'cd', 'x.jpg')]
+        for path in orphans:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file_:
+                file_.write(b'orphan')
+        out = StringIO()
+        call_command('collect_media_garbage', '--dry-run', '--min-age=0',
+                     stdout=out)
+        self.assertIn('posts/gone.gif', out.getvalue())
+        self.assertTrue(all(os.path.exists(path) for path in orphans))
+        call_command('collect_media_garbage', '--min-age=0', '--sleep=0',
+                     '--set-limit=0', stdout=StringIO())
+        self.assertFalse(any(os.path.exists(path) for path in orphans))
+        self.assertTrue(os.path.exists(live))
+
+    def test_collect_media_garbage_clears_kvstore(self):
+        '''Deleted orphans and their thumbnails leave no sorl KVStore rows.'''
+        buffer = BytesIO()
+        Image.new('RGB', (20, 10)).save(buffer, 'PNG')
+        post = Post.objects.create(
+            text='Сирота', author=self.user,
+            image=SimpleUploadedFile('orphan.png', buffer.getvalue()))
+        image = ImageFile(post.image.name, post.image.storage)
+        thumbnail = get_thumbnail(post.image, '10x10')
+        self.assertIsNotNone(default.kvstore.get(thumbnail))
+        Post.objects.filter(pk=post.pk).update(image='')
+        call_command('collect_media_garbage', '--min-age=0', '--sleep=0',
+                     stdout=StringIO())
+        self.assertFalse(os.path.exists(post.image.path))
+        self.assertIsNone(default.kvstore.get(image))
+        self.assertIsNone(default.kvstore.get(thumbnail))
+
+    def test_image_info_stored_and_backfilled(self):
+        '''Image size, colour and preview are stored and can be backfilled.'''
+        buffer = BytesIO()
+        Image.new('RGB', (300, 200), (255, 0, 0)).save(buffer, 'PNG')
+        uploaded = SimpleUploadedFile(name='red.png',
+                                      content=buffer.getvalue(),
+                                      content_type='image/png')
+        self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={'text': 'Красный', 'image': uploaded},
+        )
+        post = Post.objects.get(text='Красный')
+        self.assertEqual((post.image_width, post.image_height), (300, 200))
+        self.assertEqual(post.image_color, '#ff0000')
+        self.assertTrue(post.image_lqip.startswith('data:image/jpeg;base64,'))
+        Post.objects.update(image_width=None, image_height=None,
+                            image_color='', image_lqip='')
+        call_command('backfill_image_info', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (300, 200))
+        self.assertEqual(post.image_color, '#ff0000')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        self.posts = [
+            Post.objects.create(
+                text='Тестовый текст',
+                author=self.user,
+                image=SimpleUploadedFile(f'thumb_{i}.gif', small_gif,
+                                         'image/gif'),
+            )
+            for i in range(3)
+        ]
+        self.post = self.posts[0]
+
+    def test_queued_image_gets_thumbnails(self):
+        """Submitting an image stores its thumbnails in sorl's kvstore."""
+        source = ImageFile(self.post.image)
+        self.assertIsNone(default.kvstore.get(source))
+        self.assertTrue(thumbnails._submit(self.post.image.name))
+        self.assertIsNotNone(default.kvstore.get(source))
+
+    def test_placeholder_until_thumbnail_ready(self):
+        """Pages show a placeholder and never build thumbnails inline."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.id})
+        response = Client().get(url)
+        self.assertContains(response, 'aspect-ratio: 960 / 339')
+        self.assertNotContains(response, 'cache/')
+        response = Client().get(url)
+        self.assertNotContains(response, 'aspect-ratio: 960 / 339')
+        self.assertContains(response, 'cache/')
+        self.assertContains(response, ' 480w, ')
+
+    def test_prefetch_page_with_one_lookup(self):
+        """Thumbnails of a whole page are resolved in a single query."""
+        prefetch(Post.objects.all())
+        cache.clear()
+        posts = list(Post.objects.all())
+        with self.assertNumQueries(1):
+            prefetch(posts)
+        for post in posts:
+            self.assertEqual(post.thumbnails['card_960_jpeg'].width, 960)
+        with self.assertNumQueries(0):
+            prefetch(posts)
+
+    def use_pool(self, executor):
+        """Replace the process-wide thumbnail pool with executor."""
+        for name in ('_executor', '_executor_pid', '_pending'):
+            self.addCleanup(setattr, thumbnails, name,
+                            getattr(thumbnails, name))
+        self.addCleanup(thumbnails._in_flight.clear)
+        thumbnails._executor = executor
+        thumbnails._executor_pid = os.getpid()
+        thumbnails._pending = threading.BoundedSemaphore(2)
+
+    @override_settings(THUMBNAIL_WORKERS=1)
+    def test_image_is_queued_once_while_in_flight(self):
+        """Repeated renders do not queue the same image again."""
+        pool = FakePool()
+        self.use_pool(pool)
+        name = self.post.image.name
+        self.assertTrue(thumbnails._submit(name))
+        self.assertTrue(thumbnails._submit(name))
+        self.assertEqual(len(pool.futures), 1)
+        pool.futures[0].set_result(None)
+        self.assertTrue(thumbnails._submit(name))
+        self.assertEqual(len(pool.futures), 2)
+
+    @override_settings(THUMBNAIL_WORKERS=1)
+    def test_broken_pool_is_recreated(self):
+        """A broken pool frees its queue slot and is replaced."""
+        pool = FakePool(broken=True)
+        self.use_pool(pool)
+        pending = thumbnails._pending
+        with self.assertLogs('posts.thumbnails', 'ERROR'):
+            self.assertFalse(thumbnails._submit(self.post.image.name))
+        self.assertIsNone(thumbnails._executor)
+        self.assertTrue(pool.shut_down)
+        self.assertEqual(thumbnails._in_flight, set())
+        for _ in range(2):
+            self.assertTrue(pending.acquire(blocking=False))
+
+
+class FakePool:
+    def __init__(self, broken=False):
+        self.broken = broken
+        self.futures = []
+        self.shut_down = False
+
+    def submit(self, function, *args):
+        if self.broken:
+            raise BrokenProcessPool('worker died')
+        future = Future()
+        self.futures.append(future)
+        return future
+
+    def shutdown(self, wait=True):
+        self.shut_down = True
@@ -1,3 +1,4 @@
+
 from django.contrib.auth import get_user_model
 from django.test import TestCase
 from ..forms import PostForm, CommentForm
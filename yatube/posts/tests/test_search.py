@@ -0,0 +1,74 @@
+from django.contrib.auth import get_user_model
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Post
+from ..search import SearchResults, TokenIndexBackend
+
+User = get_user_model()
+
+
+class SearchViewTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.cat = Post.objects.create(text='Кот и кот на крыше',
+                                      author=cls.user)
+        cls.dog = Post.objects.create(text='Собака видит кота',
+                                      author=cls.user)
+        cls.both = Post.objects.create(text='Кот и собака',
+                                       author=cls.user)
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def search(self, query):
+        response = self.guest_client.get(reverse('posts:search'),
+                                         {'q': query})
+        return list(response.context['page_obj'])
+
+    def test_search_finds_posts(self):
+        """Search returns matching posts and follows edits and deletes."""
+        self.assertEqual(set(self.search('кот')), {self.cat, self.both})
+        self.assertEqual(self.search('кот собака'), [self.both])
+        self.assertEqual(self.search(''), [])
+        post = Post.objects.create(text='Попугай', author=self.user)
+        self.assertEqual(self.search('попугай'), [post])
+        post.text = 'Попугай и собака'
+        post.save()
+        self.assertEqual(self.search('попугай собака'), [post])
+        post.delete()
+        self.assertEqual(self.search('попугай'), [])
+
+    def test_results_without_stop(self):
+        """Unbounded slice of results returns every match by rank."""
+        self.assertEqual(SearchResults('кот').ids(),
+                         [self.cat.pk, self.both.pk])
+        self.assertEqual(SearchResults('кот').ids(1), [self.both.pk])
+
+    def test_admin_search_keeps_rank(self):
+        """Admin search lists posts by rank unless a column is sorted."""
+        admin_client = Client()
+        admin_client.force_login(User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass'))
+        url = reverse('admin:posts_post_changelist')
+        response = admin_client.get(url, {'q': 'кот'})
+        self.assertEqual(list(response.context['cl'].result_list),
+                         [self.cat, self.both])
+        response = admin_client.get(url, {'q': 'кот', 'o': '-1'})
+        self.assertEqual(list(response.context['cl'].result_list),
+                         [self.both, self.cat])
+        response = admin_client.get(url, {'q': 'попугай'})
+        self.assertEqual(list(response.context['cl'].result_list), [])
+
+    def test_token_index_backend(self):
+        """Fallback inverted index ranks by term frequency."""
+        backend = TokenIndexBackend()
+        for post in (self.cat, self.dog, self.both):
+            backend.index(post)
+        self.assertEqual(backend.ids(['кот'], 0, 10),
+                         [self.cat.pk, self.both.pk])
+        self.assertEqual(backend.count(['кот', 'собака']), 1)
+        backend.remove(self.cat.pk)
+        self.assertEqual(backend.ids(['кот'], 0, 10), [self.both.pk])
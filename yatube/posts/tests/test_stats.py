@@ -0,0 +1,63 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from ..models import Follow, Post, UserStats
+
+User = get_user_model()
+
+
+class UserStatsTests(TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.author = User.objects.create_user(username='author')
+
+    def get_stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_signals_update_stats(self):
+        """Post and Follow changes update the stats record."""
+        post = Post.objects.create(author=self.author, text='Текст')
+        follow = Follow.objects.create(user=self.user, author=self.author)
+        self.assertEqual(self.get_stats(self.author).posts_count, 1)
+        self.assertEqual(self.get_stats(self.author).followers_count, 1)
+        self.assertEqual(self.get_stats(self.user).following_count, 1)
+        post.delete()
+        follow.delete()
+        stats = self.get_stats(self.author)
+        self.assertEqual((stats.posts_count, stats.followers_count), (0, 0))
+        self.assertEqual(self.get_stats(self.user).following_count, 0)
+
+    def test_drifted_count_stops_at_zero(self):
+        """Deleting with a count that is already zero does not fail."""
+        post = Post.objects.create(author=self.author, text='Текст')
+        UserStats.objects.filter(user=self.author).update(posts_count=0)
+        post.delete()
+        self.assertEqual(self.get_stats(self.author).posts_count, 0)
+
+    def test_missing_stats_are_recomputed(self):
+        """A user without a stats row gets one on the next change or view."""
+        Post.objects.create(author=self.author, text='Текст')
+        UserStats.objects.all().delete()
+        Follow.objects.create(user=self.user, author=self.author)
+        self.assertEqual(self.get_stats(self.author).posts_count, 1)
+        self.assertEqual(self.get_stats(self.user).following_count, 1)
+        UserStats.objects.filter(user=self.author).delete()
+        response = self.client.get(
+            reverse('posts:profile', kwargs={'username': 'author'}))
+        self.assertContains(response, 'Всего постов: 1')
+
+    def test_repair_user_stats(self):
+        """repair_user_stats recomputes stats from the tables."""
+        Post.objects.create(author=self.author, text='Текст')
+        Follow.objects.create(user=self.user, author=self.author)
+        UserStats.objects.all().delete()
+        call_command('repair_user_stats', stdout=StringIO())
+        stats = self.get_stats(self.author)
+        self.assertEqual((stats.posts_count, stats.followers_count), (1, 1))
+        self.assertEqual(self.get_stats(self.user).following_count, 1)
@@ -0,0 +1,114 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from http import HTTPStatus
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from ..models import Post, Upload
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT,
+                   CHUNKED_UPLOAD_DIR=os.path.join(TEMP_MEDIA_ROOT, 'parts'))
+class ChunkedUploadTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.client.force_login(self.user)
+        buffer = BytesIO()
+        Image.new('RGB', (40, 30), (0, 128, 0)).save(buffer, 'PNG')
+        self.content = buffer.getvalue()
+
+    def start(self, checksum=None):
+        response = self.client.post(reverse('posts:upload_create'), {
+            'filename': 'big.png',
+            'size': len(self.content),
+            'checksum': checksum or hashlib.sha256(self.content).hexdigest(),
+        })
+        self.assertEqual(response.status_code, HTTPStatus.CREATED)
+        return reverse('posts:upload_chunk',
+                       kwargs={'token': response.json()['token']})
+
+    def send(self, url, offset, data):
+        return self.client.patch(
+            url, data, content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_resumable_upload_attached_to_post(self):
+        """Chunks resume by offset and the upload is attached by token."""
+        url = self.start()
+        half = len(self.content) // 2
+        response = self.send(url, 0, self.content[:half])
+        self.assertEqual(response.json()['offset'], half)
+        response = self.send(url, 0, self.content)
+        self.assertEqual(response.status_code, HTTPStatus.CONFLICT)
+        self.assertEqual(response['Upload-Offset'], str(half))
+        self.assertEqual(self.client.get(url).json()['offset'], half)
+        response = self.send(url, half, self.content[half:])
+        self.assertTrue(response.json()['completed'])
+        token = response.json()['token']
+        self.client.post(reverse('posts:post_create'),
+                         {'text': 'Частями', 'upload_token': token})
+        post = Post.objects.get(text='Частями')
+        self.assertEqual(post.image_width, 40)
+        self.assertFalse(Upload.objects.exists())
+
+    def test_checksum_mismatch_restarts_upload(self):
+        """A wrong checksum rejects the upload and resets the offset."""
+        url = self.start(checksum='0' * 64)
+        response = self.send(url, 0, self.content)
+        self.assertEqual(response.status_code,
+                         HTTPStatus.UNPROCESSABLE_ENTITY)
+        self.assertEqual(response['Upload-Offset'], '0')
+
+    def test_pending_uploads_are_limited(self):
+        """A user cannot keep reserving space with unfinished uploads."""
+        for _ in range(settings.CHUNKED_UPLOAD_MAX_PENDING):
+            self.start()
+        response = self.client.post(reverse('posts:upload_create'), {
+            'filename': 'big.png', 'size': 10, 'checksum': '0' * 64})
+        self.assertEqual(response.status_code, HTTPStatus.TOO_MANY_REQUESTS)
+
+    def test_part_file_symlink_is_not_followed(self):
+        """Chunks are never written through a link swapped in for a part."""
+        url = self.start()
+        upload = Upload.objects.get()
+        target = os.path.join(settings.CHUNKED_UPLOAD_DIR, 'target')
+        open(target, 'wb').close()
+        os.remove(upload.path)
+        os.symlink(target, upload.path)
+        with self.assertRaises(OSError):
+            self.send(url, 0, self.content)
+        self.assertEqual(os.path.getsize(target), 0)
+
+    def test_abandoned_uploads_expire(self):
+        """Media GC removes stale uploads and stray part files."""
+        self.start()
+        upload = Upload.objects.get()
+        Upload.objects.update(created=upload.created - timedelta(days=2))
+        stray = os.path.join(settings.CHUNKED_UPLOAD_DIR, 'stray.part')
+        open(stray, 'wb').close()
+        two_days_ago = time.time() - 2 * 24 * 60 * 60
+        os.utime(stray, (two_days_ago, two_days_ago))
+        out = StringIO()
+        call_command('collect_media_garbage', '--sleep=0', stdout=out)
+        self.assertIn('Просроченных загрузок: 2', out.getvalue())
+        self.assertFalse(Upload.objects.exists())
+        self.assertFalse(os.path.exists(upload.path))
+        self.assertFalse(os.path.exists(stray))
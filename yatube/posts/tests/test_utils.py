@@ -1,7 +1,10 @@
+
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
 from django.test import Client, TestCase
 from django.urls import reverse
-from ..utils import NUMBER_OF_POSTS
+from ..utils import NUMBER_OF_POSTS, KeysetPaginator
 from ..models import Post, Group
 
 TEST_OF_POST: int = NUMBER_OF_POSTS
@@ -20,6 +23,7 @@ class PaginatorViewTest(TestCase):
         )
 
     def setUp(self):
+        cache.clear()
         self.guest_client = Client()
         self.user = User.objects.create_user(username='HasNoName')
         self.authorized_client = Client()
@@ -69,3 +73,67 @@ class PaginatorViewTest(TestCase):
             self.assertEqual(count_posts_auth_2,
                              TEST_OF_POST,
                              error_name_4)
+
+
+class KeysetPaginatorTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        Post.objects.bulk_create(
+            Post(text=f'Тестовый текст {i}', author=cls.user)
+            for i in range(NUMBER_OF_POSTS * 2 + 3)
+        )
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def test_walk_pages_by_cursor(self):
+        '''Cursor pages cover every post once in (pub_date, id) order.'''
+        url = reverse('posts:index')
+        response = self.guest_client.get(url)
+        page_obj = response.context['page_obj']
+        self.assertFalse(page_obj.has_previous())
+        seen: list = list(page_obj)
+        while page_obj.has_next():
+            response = self.guest_client.get(
+                url, {'after': page_obj.next_cursor()})
+            page_obj = response.context['page_obj']
+            seen.extend(page_obj)
+        expected = list(Post.objects.order_by('-pub_date', '-id'))
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(page_obj), 3)
+        response = self.guest_client.get(
+            url, {'before': page_obj.previous_cursor()})
+        self.assertEqual(list(response.context['page_obj']),
+                         expected[NUMBER_OF_POSTS:NUMBER_OF_POSTS * 2])
+
+    def test_keyset_page_stands_in_for_page(self):
+        '''Page numbers and get_page(number) work like Paginator's.'''
+        paginator = KeysetPaginator(Post.objects.all(), NUMBER_OF_POSTS)
+        first = paginator.get_page()
+        self.assertEqual(first.number, 1)
+        second = paginator.get_page(after=first.next_cursor())
+        self.assertEqual(second.number, 2)
+        self.assertEqual(second.next_page_number(), 3)
+        self.assertEqual(second.start_index(), NUMBER_OF_POSTS + 1)
+        self.assertEqual(list(paginator.get_page(2)), list(second))
+
+    def test_sidebar_cache_ignores_unrelated_params(self):
+        '''Junk query strings and broken cursors share one fragment.'''
+        cache.clear()
+        url = reverse('posts:index')
+        first = self.guest_client.get(url, {'x': '1'}).context['page_obj']
+        second = self.guest_client.get(url, {'x': '2'}).context['page_obj']
+        broken = self.guest_client.get(url, {'after': '%%%'})
+        self.assertEqual(first.cache_key, second.cache_key)
+        self.assertEqual(broken.context['page_obj'].cache_key, '')
+        key = make_template_fragment_key('sidebar', ['', first.cache_key])
+        self.assertIsNotNone(cache.get(key))
+
+    def test_broken_cursor_returns_first_page(self):
+        '''Broken cursor token falls back to the first page.'''
+        response = self.guest_client.get(
+            reverse('posts:index'), {'after': '%%%'})
+        self.assertEqual(len(response.context['page_obj']), NUMBER_OF_POSTS)
+        self.assertFalse(response.context['page_obj'].has_previous())
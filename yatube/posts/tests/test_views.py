@@ -1,12 +1,13 @@
 from django.contrib.auth import get_user_model
 from django.test import Client, TestCase, override_settings
+from django.core import serializers
 from django.core.files.uploadedfile import SimpleUploadedFile
 import shutil
 import tempfile
 from django.urls import reverse
 from django import forms
-from ..models import Post, Group
-from ..utils import NUMBER_OF_POSTS
+from ..models import Post, Group, Comment
+from ..utils import NUMBER_OF_POSTS, NUMBER_OF_COMMENTS
 from django.conf import settings
 from django.core.cache import cache
 
@@ -155,3 +156,61 @@ class PostViewTests(TestCase):
         cache.clear()
         after_clear_cache = self.authorized_client.get(reverse('posts:index'))
         self.assertNotEqual(after_first_item, after_clear_cache)
+
+
+class CommentPaginationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(text='Тестовый текст', author=cls.user)
+        for i in range(NUMBER_OF_COMMENTS + 5):
+            Comment.objects.create(post=cls.post, author=cls.user,
+                                   text=f'Комментарий {i}')
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def test_comments_are_paginated(self):
+        """post_detail shows one batch, the fragment returns the rest."""
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.id}))
+        comments = response.context['comments']
+        self.assertEqual(len(comments), NUMBER_OF_COMMENTS)
+        self.assertTrue(comments.has_next())
+        response = self.guest_client.get(
+            reverse('posts:comment_list', kwargs={'post_id': self.post.id}),
+            {'after': comments.next_cursor()})
+        self.assertTemplateUsed(response, 'posts/includes/comment_list.html')
+        rest = response.context['comments']
+        self.assertEqual(len(rest), 5)
+        self.assertFalse(rest.has_next())
+        expected = list(self.post.comments.order_by('-created', '-id'))
+        self.assertEqual(list(comments) + list(rest), expected)
+
+    def test_comment_count(self):
+        """Post.comment_count follows comment create and delete."""
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, NUMBER_OF_COMMENTS + 5)
+        Comment.objects.filter(post=self.post).first().delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, NUMBER_OF_COMMENTS + 4)
+
+    def test_comment_count_never_negative(self):
+        """A drifted zero count survives a comment delete."""
+        Post.objects.filter(pk=self.post.pk).update(comment_count=0)
+        Comment.objects.filter(post=self.post).first().delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+
+    def test_loaded_comments_are_not_counted_twice(self):
+        """Fixture rows already carry their post's comment_count."""
+        comment = Comment.objects.filter(post=self.post).first()
+        data = serializers.serialize('json', [comment])
+        comment.delete()
+        Post.objects.filter(pk=self.post.pk).update(
+            comment_count=NUMBER_OF_COMMENTS + 5)
+        for obj in serializers.deserialize('json', data):
+            obj.save()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, NUMBER_OF_COMMENTS + 5)
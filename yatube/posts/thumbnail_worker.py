@@ -0,0 +1,25 @@
+"""Код процессов пула миниатюр; модели импортируются после django.setup()."""
+import os
+
+
+def init_worker(settings_module):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def generate(name, sizes):
+    from sorl.thumbnail import get_thumbnail
+    from sorl.thumbnail.images import ImageFile
+
+    from posts.models import Post
+    from posts.versions import bump, post_version_keys
+
+    # Ключи sorl зависят от хранилища, поэтому берём хранилище поля.
+    source = ImageFile(name, Post._meta.get_field('image').storage)
+    for geometry, options in sizes:
+        get_thumbnail(source, geometry, **options)
+    # Страницы с заглушкой вместо картинки получают новый ETag.
+    for post_id, author_id, group_id in Post.objects.filter(
+            image=name).values_list('pk', 'author_id', 'group_id'):
+        bump(post_version_keys(post_id, author_id, [group_id]))
@@ -0,0 +1,225 @@
+import logging
+import multiprocessing
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from PIL import features
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as CachedDBStore
+from sorl.thumbnail.models import KVStore
+
+from core import timing
+from core.query_budget import unbudgeted
+
+from . import thumbnail_worker
+
+
+logger = logging.getLogger(__name__)
+
+# Карточка поста 960x339 в нескольких ширинах для srcset.
+CARD_WIDTHS = (480, 960, 1440)
+CARD_RATIO = 339 / 960
+# WebP выдаётся, только если Pillow собран с его поддержкой.
+CARD_FORMATS = ('webp', 'jpeg') if features.check('webp') else ('jpeg',)
+
+# Все размеры, которые выводят шаблоны: post.thumbnails.card_<ширина>_<формат>.
+THUMBNAIL_SIZES = {
+    f'card_{width}_{image_format}': (
+        f'{width}x{round(width * CARD_RATIO)}',
+        {'crop': 'center', 'upscale': True, 'format': image_format.upper()},
+    )
+    for image_format in CARD_FORMATS
+    for width in CARD_WIDTHS
+}
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_pending = None
+# Имена картинок, миниатюры которых уже в очереди пула.
+_in_flight: set = set()
+
+
+class ThumbnailNames(ThumbnailBackend):
+    """Считает имя миниатюры так же, как sorl, не открывая файлов."""
+
+    def thumbnail_file(self, file_, geometry_string, **options):
+        source = ImageFile(file_)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+
+names = ThumbnailNames()
+
+
+def thumbnail_names(name, storage) -> list:
+    """Имена миниатюр всех размеров для файла картинки."""
+    source = ImageFile(name, storage)
+    return [names.thumbnail_file(source, geometry, **options).name
+            for geometry, options in THUMBNAIL_SIZES.values()]
+
+
+def _get_executor():
+    """Пул процесса и семафор его очереди; упавший пул создаётся заново."""
+    global _executor, _executor_pid, _pending
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            if _executor_pid != os.getpid():
+                _in_flight.clear()
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=thumbnail_worker.init_worker,
+                initargs=(os.environ['DJANGO_SETTINGS_MODULE'],),
+            )
+            _executor_pid = os.getpid()
+            _pending = threading.BoundedSemaphore(
+                settings.THUMBNAIL_QUEUE_SIZE)
+        return _executor, _pending
+
+
+def _discard_executor(executor) -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def _submit(name) -> bool:
+    if not settings.THUMBNAIL_WORKERS:
+        with unbudgeted():
+            thumbnail_worker.generate(name, list(THUMBNAIL_SIZES.values()))
+        return True
+    executor, pending = _get_executor()
+    with _executor_lock:
+        if name in _in_flight:
+            return True
+        if not pending.acquire(blocking=False):
+            return False
+        _in_flight.add(name)
+    try:
+        future = executor.submit(thumbnail_worker.generate, name,
+                                 list(THUMBNAIL_SIZES.values()))
+    except (BrokenProcessPool, RuntimeError):
+        logger.exception('Thumbnail pool is broken, recreating it')
+        _job_finished(name, pending)
+        _discard_executor(executor)
+        return False
+    future.add_done_callback(partial(_job_done, name, pending, executor))
+    return True
+
+
+def _job_finished(name, pending):
+    with _executor_lock:
+        _in_flight.discard(name)
+    pending.release()
+
+
+def _job_done(name, pending, executor, future):
+    _job_finished(name, pending)
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is not None:
+        logger.error('Thumbnail generation failed', exc_info=error)
+        if isinstance(error, BrokenProcessPool):
+            _discard_executor(executor)
+
+
+def enqueue(image) -> None:
+    """Ставит в очередь все миниатюры картинки после коммита."""
+    if image:
+        name = image.name
+        transaction.on_commit(lambda: _submit(name))
+
+
+def _get_many(keys) -> dict:
+    """Значения kvstore sorl: кэш одним get_many, промахи одним запросом."""
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedDBStore):
+        values = {key: kvstore._get_raw(key) for key in keys}
+        return {key: value for key, value in values.items() if value}
+    values = kvstore.cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        found = dict(KVStore.objects.filter(key__in=missing)
+                     .values_list('key', 'value'))
+        kvstore.cache.set_many(
+            {key: found.get(key, EMPTY_VALUE) for key in missing},
+            sorl_settings.THUMBNAIL_CACHE_TIMEOUT,
+        )
+        values.update(found)
+    return {key: value for key, value in values.items()
+            if value != EMPTY_VALUE}
+
+
+def prefetch(posts):
+    """Кладёт в post.thumbnails и post.srcset готовые миниатюры страницы.
+
+    Недостающие миниатюры ставятся в очередь, шаблон выводит заглушку.
+    """
+    with timing.timed('thumbnails'):
+        return _prefetch(posts)
+
+
+def _prefetch(posts):
+    wanted = defaultdict(list)
+    wanted_posts = []
+    for post in posts:
+        post.thumbnails = {}
+        post.srcset = {}
+        if not post.image:
+            continue
+        wanted_posts.append(post)
+        for size, (geometry, options) in THUMBNAIL_SIZES.items():
+            thumbnail = names.thumbnail_file(post.image, geometry, **options)
+            wanted[add_prefix(thumbnail.key)].append((post, size))
+    values = _get_many(list(wanted)) if wanted else {}
+    missing = set()
+    for key, targets in wanted.items():
+        for post, size in targets:
+            if key in values:
+                post.thumbnails[size] = deserialize_image_file(values[key])
+            else:
+                missing.add(post.image.name)
+    for post in wanted_posts:
+        post.srcset = _srcset(post.thumbnails)
+    for name in missing:
+        _submit(name)
+    timing.count('thumbnails_queued', len(missing))
+    return posts
+
+
+def _srcset(thumbnails) -> dict:
+    srcset = {}
+    for image_format in CARD_FORMATS:
+        variants = [
+            f'{thumbnail.url} {width}w'
+            for width in CARD_WIDTHS
+            for thumbnail in [thumbnails.get(f'card_{width}_{image_format}')]
+            if thumbnail
+        ]
+        if variants:
+            srcset[image_format] = ', '.join(variants)
+    return srcset
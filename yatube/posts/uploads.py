@@ -0,0 +1,155 @@
+import hashlib
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.utils import timezone
+
+from .models import Upload
+
+
+# Сколько байт тела запроса читается за раз.
+CHUNK_SIZE: int = 64 * 1024
+
+
+class UploadError(Exception):
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+def _open_part(upload, mode):
+    """Файл части загрузки; по символической ссылке не открывается."""
+    flags = os.O_RDONLY if mode == 'rb' else os.O_RDWR
+    return open(os.open(upload.path, flags | os.O_NOFOLLOW), mode)
+
+
+def start(user, filename, size, checksum) -> Upload:
+    if not 0 < size <= settings.CHUNKED_UPLOAD_MAX_SIZE:
+        raise UploadError('Недопустимый размер файла', 413)
+    if len(checksum) != 64:
+        raise UploadError('Нужна контрольная сумма sha256', 400)
+    pending = Upload.objects.filter(
+        user=user, completed=False,
+        created__gte=timezone.now() - timedelta(
+            seconds=settings.CHUNKED_UPLOAD_TTL),
+    ).count()
+    if pending >= settings.CHUNKED_UPLOAD_MAX_PENDING:
+        raise UploadError('Слишком много незавершённых загрузок', 429)
+    upload = Upload.objects.create(user=user, filename=filename[:255],
+                                   size=size, checksum=checksum.lower())
+    os.makedirs(settings.CHUNKED_UPLOAD_DIR, mode=0o700, exist_ok=True)
+    os.close(os.open(
+        upload.path,
+        os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_NOFOLLOW, 0o600))
+    return upload
+
+
+def append(upload, offset, stream) -> Upload:
+    """Дописывает тело запроса с offset, читая его по CHUNK_SIZE байт."""
+    if upload.completed:
+        raise UploadError('Загрузка уже завершена', 409)
+    if offset != upload.offset:
+        raise UploadError('Неверное смещение', 409)
+    written = 0
+    with _open_part(upload, 'r+b') as file_:
+        file_.seek(offset)
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            written += len(chunk)
+            if offset + written > upload.size:
+                file_.truncate(offset)
+                raise UploadError('Данные длиннее объявленного размера', 413)
+            file_.write(chunk)
+    # Параллельный запрос с тем же смещением проиграет здесь.
+    if not Upload.objects.filter(pk=upload.pk, offset=offset).update(
+            offset=offset + written):
+        raise UploadError('Неверное смещение', 409)
+    upload.offset = offset + written
+    if upload.offset == upload.size:
+        _complete(upload)
+    return upload
+
+
+def _complete(upload):
+    digest = hashlib.sha256()
+    with _open_part(upload, 'rb') as file_:
+        for chunk in iter(lambda: file_.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    if digest.hexdigest() != upload.checksum:
+        # Начинаем заново: непонятно, какая часть файла испорчена.
+        with _open_part(upload, 'r+b') as file_:
+            file_.truncate(0)
+        upload.offset = 0
+        upload.save(update_fields=['offset'])
+        raise UploadError('Контрольная сумма не совпала', 422)
+    upload.completed = True
+    upload.save(update_fields=['completed'])
+
+
+def _find(request):
+    token = request.POST.get('upload_token')
+    if not token or 'image' in request.FILES:
+        return None
+    try:
+        token = uuid.UUID(token)
+    except ValueError:
+        return None
+    return Upload.objects.filter(pk=token, user=request.user,
+                                 completed=True).first()
+
+
+@contextmanager
+def attached(request):
+    """request.FILES с картинкой из завершённой загрузки upload_token.
+
+    Файл загрузки открыт, пока выполняется блок with.
+    """
+    upload = _find(request)
+    if upload is None:
+        yield request.FILES or None, None
+        return
+    files = request.FILES.copy()
+    with _open_part(upload, 'rb') as file_:
+        files['image'] = UploadedFile(file_, name=upload.filename,
+                                      size=upload.size)
+        yield files, upload
+
+
+def discard(upload) -> None:
+    if upload is None:
+        return
+    try:
+        os.remove(upload.path)
+    except FileNotFoundError:
+        pass
+    upload.delete()
+
+
+def expire(ttl, dry_run=False) -> int:
+    """Удаляет загрузки старше ttl секунд и части файлов без загрузок."""
+    deadline = timezone.now() - timedelta(seconds=ttl)
+    expired = 0
+    for upload in Upload.objects.filter(created__lt=deadline).iterator():
+        if not dry_run:
+            discard(upload)
+        expired += 1
+    known = {f'{token}.part' for token in
+             Upload.objects.values_list('token', flat=True)}
+    try:
+        entries = list(os.scandir(settings.CHUNKED_UPLOAD_DIR))
+    except FileNotFoundError:
+        return expired
+    for entry in entries:
+        if (entry.name.endswith('.part') and entry.name not in known
+                and entry.stat().st_mtime < time.time() - ttl):
+            if not dry_run:
+                os.remove(entry.path)
+            expired += 1
+    return expired
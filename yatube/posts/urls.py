@@ -13,10 +13,19 @@ urlpatterns = [
     path('profile/<str:username>/', views.profile, name='profile'),
     # post view
     path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    # full-text search
+    path('search/', views.search, name='search'),
     # post create
     path('create/', views.post_create, name='post_create'),
     # post edit
     path('posts/<int:post_id>/edit/', views.post_edit, name='post_edit'),
+    # chunked image upload attached to the post form by token
+    path('uploads/', views.upload_create, name='upload_create'),
+    path('uploads/<uuid:token>/', views.upload_chunk, name='upload_chunk'),
+    # next batch of comments of post
+    path('posts/<int:post_id>/comments/',
+         views.comment_list,
+         name='comment_list'),
     # add comment of post
     path('posts/<int:post_id>/comment/',
          views.add_comment,
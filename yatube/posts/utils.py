@@ -1,11 +1,196 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from . import counters
 
 
 NUMBER_OF_POSTS = 10
+NUMBER_OF_COMMENTS = 20
+
+
+def encode_key(key) -> str:
+    """Кодирует позицию (дата, id) в непрозрачный токен."""
+    date, pk = key
+    raw = f'{date.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def encode_cursor(obj, date_field='pub_date') -> str:
+    return encode_key((getattr(obj, date_field), obj.pk))
+
+
+def decode_cursor(token):
+    """Возвращает (pub_date, id) из токена или None для битого токена."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        pub_date, pk = raw.decode().rsplit('|', 1)
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+class KeysetPage(Page):
+    """Страница курсорной пагинации, которую можно передать вместо Page.
+
+    Соседние страницы известны без COUNT(*); номер страницы и индексы
+    постов считаются одним COUNT, только если их кто-то спросит.
+    """
+
+    def __init__(self, object_list, paginator, has_next, has_previous,
+                 cache_key=''):
+        # Page.__init__ не вызывается: он записал бы number = None.
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+        # Ключ кэша фрагмента: разобранный курсор, а не строка запроса.
+        self.cache_key = cache_key
+
+    def __repr__(self):
+        return '<Keyset page>'
+
+    @cached_property
+    def number(self):
+        """Номер страницы, на которую приходится первый пост."""
+        if not self._has_previous or not self.object_list:
+            return 1
+        newer = self.paginator.count_newer(self.object_list[0])
+        return newer // self.paginator.per_page + 1
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return encode_cursor(self.object_list[-1],
+                                 self.paginator.date_field)
+        return None
+
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return encode_cursor(self.object_list[0],
+                                 self.paginator.date_field)
+        return None
 
 
-def my_paginator(post_list, request):
-    paginator = Paginator(post_list, NUMBER_OF_POSTS)
+class KeysetPaginator(Paginator):
+    """Пагинация по ключу (дата, id) без COUNT(*) и OFFSET.
+
+    Страницы адресуются токенами ?after=/?before=, поэтому глубина
+    листания не влияет на стоимость запроса. Остальной интерфейс
+    Paginator (count, page(number)) работает как обычно.
+    """
+    keyset = True
+
+    def __init__(self, object_list, per_page, date_field='pub_date'):
+        super().__init__(object_list, per_page)
+        self.date_field = date_field
+
+    def _after(self, key):
+        date, pk = key
+        return (Q(**{f'{self.date_field}__lt': date})
+                | Q(**{self.date_field: date, 'pk__lt': pk}))
+
+    def _before(self, key):
+        date, pk = key
+        return (Q(**{f'{self.date_field}__gt': date})
+                | Q(**{self.date_field: date, 'pk__gt': pk}))
+
+    def _older(self, key, limit) -> list:
+        """До limit записей старше key (без key — самые новые)."""
+        queryset = self.object_list
+        if key is not None:
+            queryset = queryset.filter(self._after(key))
+        return list(queryset.order_by(f'-{self.date_field}', '-pk')[:limit])
+
+    def _newer(self, key, limit) -> list:
+        """До limit записей новее key, начиная с ближайшей к нему."""
+        return list(self.object_list.filter(self._before(key))
+                    .order_by(self.date_field, 'pk')[:limit])
+
+    def count_newer(self, obj) -> int:
+        key = getattr(obj, self.date_field), obj.pk
+        return self.object_list.filter(self._before(key)).count()
+
+    def get_page(self, number=None, after=None, before=None):
+        """Страница по курсору; number, как у Paginator, без курсоров."""
+        if number is not None and after is None and before is None:
+            return super().get_page(number)
+        before_key = decode_cursor(before)
+        after_key = decode_cursor(after)
+        if before_key is not None:
+            rows = self._newer(before_key, self.per_page + 1)
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            rows.reverse()
+            return KeysetPage(rows, self, True, has_previous,
+                              f'before={encode_key(before_key)}')
+        rows = self._older(after_key, self.per_page + 1)
+        has_next = len(rows) > self.per_page
+        return KeysetPage(
+            rows[:self.per_page], self, has_next, after_key is not None,
+            f'after={encode_key(after_key)}' if after_key else '',
+        )
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, берущий число постов из счётчиков posts.counters."""
+
+    def __init__(self, object_list, per_page, count_key):
+        super().__init__(object_list, per_page)
+        self.count_key = count_key
+
+    @cached_property
+    def count(self):
+        return counters.get_count(self.count_key, self.object_list)
+
+    def page(self, number):
+        page = super().page(number)
+        if self._is_stale(page):
+            # Счётчик врёт: сбрасываем его, следующий запрос пересчитает.
+            counters.invalidate([self.count_key])
+        return page
+
+    def _is_stale(self, page):
+        if len(page) < self.per_page:
+            # Завышен: страница неполная, а после неё есть ещё страницы.
+            return page.has_next() or not len(page) and self.count
+        # Занижен: полная последняя страница, а за ней есть посты.
+        return (not page.has_next()
+                and self.object_list[page.end_index():].exists())
+
+
+def my_paginator(post_list, request, keyset=False, count_key=None):
+    if keyset:
+        paginator = KeysetPaginator(post_list, NUMBER_OF_POSTS)
+        return paginator.get_page(
+            after=request.GET.get('after'),
+            before=request.GET.get('before'),
+        )
+    if count_key is not None:
+        paginator = CachedCountPaginator(post_list, NUMBER_OF_POSTS, count_key)
+    else:
+        paginator = Paginator(post_list, NUMBER_OF_POSTS)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     return page_obj
+
+
+def comments_page(comment_list, request):
+    paginator = KeysetPaginator(comment_list, NUMBER_OF_COMMENTS,
+                                date_field='created')
+    return paginator.get_page(after=request.GET.get('after'))
@@ -0,0 +1,97 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+
+from .models import Group, Post, User
+
+
+VERSION_KEY_PREFIX = 'posts:version'
+# Имя автора видно в ленте, на его странице и на страницах его постов.
+AUTHOR_NAME_FIELDS = ('username', 'first_name', 'last_name')
+
+
+def version_key(kind, pk=None) -> str:
+    """Ключ кэша со временем последнего изменения ленты или поста."""
+    if pk is None:
+        return f'{VERSION_KEY_PREFIX}:{kind}'
+    return f'{VERSION_KEY_PREFIX}:{kind}:{pk}'
+
+
+def post_version_keys(post_id, author_id, group_ids) -> list:
+    """Ключи всех страниц, на которых виден пост."""
+    keys = [version_key('all'), version_key('author', author_id),
+            version_key('post', post_id)]
+    keys.extend(version_key('group', group_id)
+                for group_id in group_ids if group_id is not None)
+    return keys
+
+
+def author_version_keys(author_id) -> list:
+    """Ключи страниц, на которых видно имя автора."""
+    keys = [version_key('all'), version_key('author', author_id)]
+    keys.extend(version_key('post', post_id) for post_id in
+                Post.objects.filter(author_id=author_id)
+                .values_list('pk', flat=True).iterator())
+    return keys
+
+
+def _shared_cache():
+    """Общий уровень TwoTierCache: локальная копия версии может устареть."""
+    return getattr(cache, 'shared', cache)
+
+
+def bump(keys) -> None:
+    now = time.time()
+    cache.set_many({key: now for key in keys}, timeout=None)
+
+
+def make_etag(request, keys):
+    """ETag из версий страницы, пользователя и параметров запроса.
+
+    В страницах есть {% csrf_token %}: после входа токен новый, и старая
+    копия страницы из кэша браузера не должна получить 304.
+    """
+    versions = _shared_cache().get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        now = time.time()
+        cache.set_many({key: now for key in missing}, timeout=None)
+        versions.update(dict.fromkeys(missing, now))
+    raw = '|'.join(
+        [request.path, request.GET.urlencode(), str(request.user.pk),
+         request.META.get('CSRF_COOKIE', '')]
+        + [repr(versions[key]) for key in keys]
+    )
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def index_etag(request):
+    return make_etag(request, [version_key('all')])
+
+
+def group_etag(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True).first()
+    if group_id is None:
+        return None
+    return make_etag(request, [version_key('group', group_id)])
+
+
+def profile_etag(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True).first()
+    if author_id is None:
+        return None
+    return make_etag(request, [version_key('author', author_id)])
+
+
+def post_etag(request, post_id):
+    post = Post.objects.filter(pk=post_id).values_list(
+        'author_id', 'group_id').first()
+    if post is None:
+        return None
+    author_id, group_id = post
+    return make_etag(request, [version_key('post', post_id),
+                               version_key('author', author_id),
+                               version_key('group', group_id)])
@@ -1,38 +1,62 @@
+from urllib.parse import urlencode
+
+from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Post, Group, User, Follow
-from .utils import my_paginator
+from core.query_budget import query_budget
+from .models import Post, Group, User, Follow, Upload
+from .utils import comments_page, my_paginator
+from .counters import count_key
+from .feed import feed_page
+from . import thumbnails, uploads
+from .search import SearchResults
+from .stats import get_stats
+from .versions import group_etag, index_etag, post_etag, profile_etag
 from .forms import PostForm, CommentForm
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import condition, require_http_methods
 
 
+@query_budget(6)
+@condition(etag_func=index_etag)
 def index(request):
     post_list = Post.objects.select_related(
         'author', 'group')
     context: dict = {
-        'page_obj': my_paginator(post_list, request),
+        'page_obj': thumbnails.prefetch(
+            my_paginator(post_list, request, keyset=True)),
         'title': 'Это главная страница сервиса Yatube',
     }
     return render(request, 'posts/index.html', context)
 
 
+@query_budget(7)
+@condition(etag_func=group_etag)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
     post_list = group.posts.select_related('author')
 
     context: dict = {
         'group': group,
-        'page_obj': my_paginator(post_list, request),
+        'page_obj': thumbnails.prefetch(my_paginator(
+            post_list, request, count_key=count_key(group_id=group.pk))),
         'title': 'Записи сообщества ' + f'"{group.title}"'
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@query_budget(7)
+@condition(etag_func=profile_etag)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(
+        User.objects.select_related('stats'),
+        username=username,
+    )
+    get_stats(author)
     post_list = author.posts.select_related('group')
     context = {
         'author': author,
-        'page_obj': my_paginator(post_list, request),
+        'page_obj': thumbnails.prefetch(my_paginator(
+            post_list, request, count_key=count_key(author_id=author.pk))),
         'title': 'Профайл пользователя '
                  + f'{author.first_name} {author.last_name}'
                  + '.',
@@ -40,12 +64,16 @@ def profile(request, username):
     return render(request, 'posts/profile.html', context)
 
 
+@query_budget(7)
+@condition(etag_func=post_etag)
 def post_detail(request, post_id):
     post = get_object_or_404(
-        Post.objects.select_related('author', 'group'),
+        Post.objects.select_related('author__stats', 'group'),
         pk=post_id,
     )
-    comments = post.comments.select_related('author')
+    get_stats(post.author)
+    thumbnails.prefetch([post])
+    comments = comments_page(post.comments.select_related('author'), request)
     form = CommentForm(request.POST or None)
     context = {
         'post': post,
@@ -55,30 +83,62 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+@query_budget(4)
+def comment_list(request, post_id):
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    comments = comments_page(post.comments.select_related('author'), request)
+    context = {
+        'post': post,
+        'comments': comments,
+    }
+    return render(request, 'posts/includes/comment_list.html', context)
+
+
+@query_budget(7)
+def search(request):
+    query = request.GET.get('q', '').strip()
+    context = {
+        'query': query,
+        'page_obj': thumbnails.prefetch(
+            my_paginator(SearchResults(query), request)),
+        'page_query': urlencode({'q': query}) + '&',
+        'title': 'Поиск по записям',
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@query_budget(16)
 @login_required
 def post_create(request):
-    form = PostForm(request.POST or None, files=request.FILES or None)
-    if form.is_valid():
-        post = form.save(commit=False)
-        post.author = request.user
-        post.save()
-        return redirect('posts:profile', request.user)
+    with uploads.attached(request) as (files, upload):
+        form = PostForm(request.POST or None, files=files)
+        if form.is_valid():
+            post = form.save(commit=False)
+            post.author = request.user
+            post.save()
+            uploads.discard(upload)
+            thumbnails.enqueue(post.image)
+            return redirect('posts:profile', request.user)
     return render(request, 'posts/create_post.html', {'form': form})
 
 
+@query_budget(17)
 @login_required
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
-    form = PostForm(
-        request.POST or None,
-        files=request.FILES or None,
-        instance=post,
-    )
-    if not post.author == request.user:
+    if post.author_id != request.user.pk:
         return redirect('posts:post_detail', post_id)
-    else:
+    with uploads.attached(request) as (files, upload):
+        form = PostForm(
+            request.POST or None,
+            files=files,
+            instance=post,
+        )
         if form.is_valid():
-            form.save()
+            post = form.save()
+            uploads.discard(upload)
+            if 'image' in form.changed_data:
+                thumbnails.enqueue(post.image)
             return redirect('posts:post_detail', post_id)
     context = {
         'form': form,
@@ -88,6 +148,59 @@ def post_edit(request, post_id):
     return render(request, 'posts/create_post.html', context)
 
 
+def _upload_response(upload):
+    response = JsonResponse({
+        'token': str(upload.token),
+        'offset': upload.offset,
+        'size': upload.size,
+        'completed': upload.completed,
+    })
+    response['Upload-Offset'] = upload.offset
+    return response
+
+
+@query_budget(5)
+@login_required
+@require_http_methods(['POST'])
+def upload_create(request):
+    try:
+        upload = uploads.start(
+            request.user,
+            request.POST.get('filename', ''),
+            int(request.POST.get('size', 0)),
+            request.POST.get('checksum', ''),
+        )
+    except ValueError:
+        return JsonResponse({'error': 'Неверный размер файла'}, status=400)
+    except uploads.UploadError as error:
+        return JsonResponse({'error': str(error)}, status=error.status)
+    response = _upload_response(upload)
+    response.status_code = 201
+    return response
+
+
+@query_budget(6)
+@login_required
+@require_http_methods(['GET', 'HEAD', 'PATCH'])
+def upload_chunk(request, token):
+    upload = get_object_or_404(Upload, pk=token, user=request.user)
+    if request.method == 'PATCH':
+        try:
+            uploads.append(upload, int(request.META['HTTP_UPLOAD_OFFSET']),
+                           request)
+        except (KeyError, ValueError):
+            return JsonResponse({'error': 'Нужен заголовок Upload-Offset'},
+                                status=400)
+        except uploads.UploadError as error:
+            response = JsonResponse({'error': str(error)},
+                                    status=error.status)
+            upload.refresh_from_db()
+            response['Upload-Offset'] = upload.offset
+            return response
+    return _upload_response(upload)
+
+
+@query_budget(7)
 @login_required
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
@@ -100,14 +213,17 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@query_budget(9)
 @login_required
 def follow_index(request):
     template = 'posts/follow.html'
-    post_list = Post.objects.filter(author__following__user=request.user)
-    context = {'page_obj': my_paginator(post_list, request)}
+    context = {
+        'page_obj': thumbnails.prefetch(feed_page(request.user, request)),
+    }
     return render(request, template, context)
 
 
+@query_budget(12)
 @login_required
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
@@ -117,6 +233,7 @@ def profile_follow(request, username):
     return redirect('posts:profile', username=username)
 
 
+@query_budget(8)
 @login_required
 def profile_unfollow(request, username):
     user = request.user
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import sys
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -25,6 +26,9 @@ SECRET_KEY = 'qwb2qpz6%a$e=pt#llp#-g20h14&)320e=)d%_(t&4)kr%%t!n'
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
+# Тесты не должны делить кэш, метрики и логи с работающим сайтом.
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+
 ALLOWED_HOSTS = [
     'localhost',
     '127.0.0.1',
@@ -50,6 +54,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.timing.TimingMiddleware',
+    'core.query_budget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -57,6 +63,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.profiler.ProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -65,7 +72,7 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.timing.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -146,10 +153,113 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# default: небольшой LRU в каждом процессе поверх общего кэша shared.
+# Значения без срока (счётчики, версии) в LRU не попадают, остальные
+# другие воркеры видят с задержкой до LOCAL_TIMEOUT секунд.
+# Файлы, общие для воркеров узла: каталог только для владельца, а не
+# общий /tmp, где файл заранее может создать другой пользователь.
+RUN_DIR = os.environ.get('YATUBE_RUN_DIR', os.path.join(BASE_DIR, 'run'))
+
 CACHES = {
     'default': {
+        'BACKEND': 'core.cache.TwoTierCache',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 5,
+        },
+    },
+    # Общий для всех воркеров узла кэш в memory-mapped файле.
+    'shared': {
+        'BACKEND': 'core.mmap_cache.MmapCache',
+        'LOCATION': os.path.join(RUN_DIR, 'cache'),
+        'OPTIONS': {
+            'SLOTS': 8192,
+            'SLOT_SIZE': 32768,
+        },
+    },
+}
+if TESTING:
+    CACHES['shared'] = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'yatube-tests',
     }
-}
 
 CSRF_FAILURE_VIEW = 'core.views.forbidden'
+
+# Посты авторов с большим числом подписчиков не раскладываются по лентам,
+# а подмешиваются при чтении ленты подписок.
+FEED_FANOUT_THRESHOLD = 1000
+
+# Миниатюры создаёт пул процессов после коммита; 0 — создавать сразу
+# (в тестах, или YATUBE_THUMBNAIL_WORKERS=0).
+THUMBNAIL_WORKERS = 0 if TESTING else int(
+    os.environ.get('YATUBE_THUMBNAIL_WORKERS', 2))
+THUMBNAIL_QUEUE_SIZE = 100
+
+# Незаконченные загрузки картинок частями (posts.uploads): каталог только
+# для владельца, вне MEDIA_ROOT, чтобы части не раздавались как медиа.
+CHUNKED_UPLOAD_DIR = os.path.join(BASE_DIR, 'uploads')
+CHUNKED_UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+# Незавершённых загрузок на пользователя; через CHUNKED_UPLOAD_TTL секунд
+# загрузку удаляет collect_media_garbage.
+CHUNKED_UPLOAD_MAX_PENDING = 3
+CHUNKED_UPLOAD_TTL = 24 * 60 * 60
+
+# Превышение объявленного бюджета SQL-запросов представления — ошибка
+# (core.query_budget); проверка включена при разработке и в тестах.
+QUERY_BUDGET_ENABLED = DEBUG
+
+# Метрики запросов всех воркеров узла для /metrics (core.metrics);
+# None — не собирать. /metrics отдаётся адресам METRICS_ALLOWED_IPS или
+# с заголовком Authorization: Bearer <METRICS_TOKEN>.
+METRICS_PATH = None if TESTING else os.path.join(RUN_DIR, 'metrics')
+METRICS_SLOTS = 4096
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1'] if DEBUG else []
+METRICS_TOKEN = os.environ.get('YATUBE_METRICS_TOKEN')
+# Модель: функция, которая отдаёт число её строк, или None — COUNT(*),
+# закэшированный на минуту.
+METRICS_TABLE_GAUGES = {
+    'posts.Post': 'posts.counters.total_count',
+    'posts.Comment': None,
+    'posts.Follow': None,
+}
+
+# Профиль запроса сотрудника с ?_profile=1 (core.profiler); хранятся
+# последние PROFILER_KEEP профилей.
+PROFILER_ENABLED = True
+PROFILER_KEEP = 100
+
+# Запросы к БД дольше SLOW_QUERY_MS миллисекунд пишутся в SLOW_QUERY_LOG
+# (core.slow_queries); None — не следить. Файл доступен только владельцу.
+SLOW_QUERY_MS = 100
+SLOW_QUERY_LOG = os.devnull if TESTING else os.path.join(
+    BASE_DIR, 'logs', 'slow-queries.log')
+
+# Строки лога с замерами запросов (core.timing) пишутся в продакшене,
+# медленные запросы (core.slow_queries) — всегда.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+        'slow_queries': {
+            'class': 'core.logs.PrivateFileHandler',
+            'filename': SLOW_QUERY_LOG,
+            'encoding': 'utf-8',
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'core.timing': {
+            'handlers': ['console'],
+            'level': 'WARNING' if DEBUG else 'INFO',
+            'propagate': False,
+        },
+        'core.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}